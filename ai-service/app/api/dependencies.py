@@ -0,0 +1,7 @@
+from fastapi import Request
+
+from app.services.recommendation_service import RecommendationService
+
+def get_recommendation_service(request: Request) -> RecommendationService:
+    """Return the worker-wide RecommendationService created at startup"""
+    return request.app.state.recommendation_service
@@ -1,11 +1,19 @@
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, Body, Depends, HTTPException
 from sqlalchemy.ext.asyncio import AsyncSession
-from typing import List, Optional
+from typing import Dict, List, Optional
 import json
 
+from app.core.config import settings
 from app.core.database import get_db
+from app.api.dependencies import get_recommendation_service
+from app.services.event_buffer import EventBufferFull
 from app.services.recommendation_service import RecommendationService
-from app.schemas.recommendation import RecommendationResponse, UserEventCreate
+from app.schemas.recommendation import (
+    RecommendationResponse,
+    RecommendationBatchRequest,
+    UserEventCreate,
+    UserEventBatch
+)
 
 router = APIRouter()
 
@@ -15,13 +23,13 @@ async def get_recommendations(
     latitude: Optional[float] = None,
     longitude: Optional[float] = None,
     limit: int = 10,
-    db: AsyncSession = Depends(get_db)
+    db: AsyncSession = Depends(get_db),
+    recommendation_service: RecommendationService = Depends(get_recommendation_service)
 ):
     """
     Get personalized product recommendations for a user
     """
     try:
-        recommendation_service = RecommendationService()
         recommendations = await recommendation_service.get_recommendations(
             user_id=user_id,
             latitude=latitude,
@@ -33,33 +41,80 @@ async def get_recommendations(
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Failed to get recommendations: {str(e)}")
 
+@router.post("/recommendations/batch", response_model=Dict[str, List[RecommendationResponse]])
+async def get_recommendations_batch(
+    batch: RecommendationBatchRequest,
+    db: AsyncSession = Depends(get_db),
+    recommendation_service: RecommendationService = Depends(get_recommendation_service)
+):
+    """
+    Compute and cache recommendations for many users at once, keyed by user id
+    """
+    if len(batch.user_ids) > settings.recommendation_batch_max_size:
+        raise HTTPException(
+            status_code=413,
+            detail=f"Batch too large: at most {settings.recommendation_batch_max_size} users per request"
+        )
+
+    try:
+        return await recommendation_service.get_recommendations_batch(
+            user_ids=batch.user_ids,
+            limit=batch.limit,
+            db=db
+        )
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Failed to get batch recommendations: {str(e)}")
+
 @router.post("/events")
 async def track_user_event(
     event: UserEventCreate,
-    db: AsyncSession = Depends(get_db)
+    recommendation_service: RecommendationService = Depends(get_recommendation_service)
 ):
     """
     Track user events for recommendation learning
     """
     try:
-        recommendation_service = RecommendationService()
-        await recommendation_service.track_event(event, db)
+        await recommendation_service.track_event(event)
         return {"message": "Event tracked successfully"}
+    except EventBufferFull as e:
+        raise HTTPException(status_code=503, detail=f"Event ingestion overloaded: {str(e)}")
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Failed to track event: {str(e)}")
 
+@router.post("/events/batch")
+async def track_user_events(
+    batch: UserEventBatch,
+    recommendation_service: RecommendationService = Depends(get_recommendation_service)
+):
+    """
+    Track many user events in one request
+    """
+    if len(batch.events) > settings.event_batch_max_size:
+        raise HTTPException(
+            status_code=413,
+            detail=f"Batch too large: at most {settings.event_batch_max_size} events per request"
+        )
+
+    try:
+        await recommendation_service.track_events(batch.events)
+        return {"message": "Events tracked successfully", "count": len(batch.events)}
+    except EventBufferFull as e:
+        raise HTTPException(status_code=503, detail=f"Event ingestion overloaded: {str(e)}")
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Failed to track events: {str(e)}")
+
 @router.get("/trending/{latitude}/{longitude}")
 async def get_trending_products(
     latitude: float,
     longitude: float,
     limit: int = 10,
-    db: AsyncSession = Depends(get_db)
+    db: AsyncSession = Depends(get_db),
+    recommendation_service: RecommendationService = Depends(get_recommendation_service)
 ):
     """
     Get trending products in user's area
     """
     try:
-        recommendation_service = RecommendationService()
         trending = await recommendation_service.get_trending_products(
             latitude=latitude,
             longitude=longitude,
@@ -75,13 +130,13 @@ async def get_popular_shops(
     latitude: float,
     longitude: float,
     limit: int = 10,
-    db: AsyncSession = Depends(get_db)
+    db: AsyncSession = Depends(get_db),
+    recommendation_service: RecommendationService = Depends(get_recommendation_service)
 ):
     """
     Get popular shops in user's area
     """
     try:
-        recommendation_service = RecommendationService()
         popular = await recommendation_service.get_popular_shops(
             latitude=latitude,
             longitude=longitude,
@@ -90,4 +145,18 @@ async def get_popular_shops(
         )
         return popular
     except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Failed to get popular shops: {str(e)}")
\ No newline at end of file
+        raise HTTPException(status_code=500, detail=f"Failed to get popular shops: {str(e)}")
+
+@router.post("/products/invalidate-cache")
+async def invalidate_product_cache(
+    product_ids: List[str] = Body(...),
+    recommendation_service: RecommendationService = Depends(get_recommendation_service)
+):
+    """
+    Drop cached product information after products are updated
+    """
+    try:
+        await recommendation_service.invalidate_products(product_ids)
+        return {"message": "Product cache invalidated", "count": len(product_ids)}
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Failed to invalidate product cache: {str(e)}")
\ No newline at end of file
@@ -1,20 +1,34 @@
+from contextlib import asynccontextmanager
+from typing import Any, Dict
+
+from sqlalchemy import text
 from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
 from sqlalchemy.orm import sessionmaker
 from sqlalchemy.ext.declarative import declarative_base
-import databases
 from app.core.config import settings
 
 # SQLAlchemy setup
 DATABASE_URL = settings.database_url.replace("postgresql://", "postgresql+asyncpg://")
 
-engine = create_async_engine(DATABASE_URL, echo=True)
+# One engine for the web workers, the event buffer and the background jobs
+engine = create_async_engine(
+    DATABASE_URL,
+    echo=settings.database_echo,
+    pool_size=settings.database_pool_size,
+    max_overflow=settings.database_max_overflow,
+    pool_timeout=settings.database_pool_timeout_seconds,
+    pool_recycle=settings.database_pool_recycle_seconds,
+    pool_pre_ping=True,
+    connect_args={
+        # Prepared statements are cached per connection, keyed by SQL text
+        "prepared_statement_cache_size": settings.database_statement_cache_size,
+        "server_settings": {"statement_timeout": str(settings.database_statement_timeout_ms)},
+    },
+)
 async_session = sessionmaker(engine, class_=AsyncSession, expire_on_commit=False)
 
 Base = declarative_base()
 
-# Databases setup for simpler queries
-database = databases.Database(DATABASE_URL)
-
 async def get_db():
     async with async_session() as session:
         try:
@@ -25,8 +39,26 @@ async def get_db():
 async def create_tables():
     async with engine.begin() as conn:
         # Import all models here to ensure they are registered
-        from app.models import user_events
+        from app.models import user_events, shop_order_rollups
         await conn.run_sync(Base.metadata.create_all)
+        # Nullable columns without defaults, so adding them is a quick catalogue change
+        for statement in user_events.ADDED_COLUMNS:
+            await conn.execute(text(statement))
+
+@asynccontextmanager
+async def batch_connection():
+    """Connection for long-running job queries: one transaction using the batch statement timeout"""
+    async with engine.begin() as conn:
+        await conn.execute(text(f"SET LOCAL statement_timeout = {int(settings.batch_statement_timeout_ms)}"))
+        yield conn
 
-async def get_database():
-    return database
\ No newline at end of file
+def get_pool_stats() -> Dict[str, Any]:
+    """Connection pool usage for this process"""
+    pool = engine.pool
+    return {
+        "size": pool.size(),
+        "checked_out": pool.checkedout(),
+        "checked_in": pool.checkedin(),
+        "overflow": max(0, pool.overflow()),
+        "max_overflow": settings.database_max_overflow,
+    }
@@ -0,0 +1,151 @@
+import contextvars
+import json
+import resource
+import time
+from contextlib import contextmanager
+from typing import Dict, List, Optional
+
+from prometheus_client import Counter, Gauge, Histogram
+from sqlalchemy import event
+
+from app.core.database import engine, get_pool_stats
+from app.services.model_registry import ModelRegistry
+
+# Redis key the retraining job writes its last run to, per mode; the web workers report it
+RETRAIN_RUN_KEY = "retrain:last_run:{mode}"
+
+REQUEST_SECONDS = Histogram(
+    "http_request_duration_seconds",
+    "HTTP request latency by route",
+    ["method", "route", "status"],
+)
+STAGE_SECONDS = Histogram(
+    "recommendation_stage_duration_seconds",
+    "Time spent in each stage of the recommendation pipeline",
+    ["stage"],
+    buckets=(0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5),
+)
+CANDIDATE_SOURCE_FAILURES = Counter(
+    "recommendation_candidate_source_failures_total",
+    "Candidate sources left out of the blend",
+    ["source", "reason"],
+)
+CACHE_REQUESTS = Counter(
+    "cache_requests_total",
+    "Cache lookups by layer and result (hit, stale or miss); stale entries are served while they refresh",
+    ["layer", "result"],
+)
+CACHE_COALESCED = Counter(
+    "cache_coalesced_requests_total",
+    "Cache misses that did not run their own computation: joined one in this worker, got the value"
+    " another worker stored, or gave up waiting on another worker's lock",
+    ["layer", "outcome"],
+)
+CACHE_STALE_AGE_SECONDS = Histogram(
+    "cache_stale_age_seconds",
+    "How long past its soft TTL an entry was when served stale",
+    ["layer"],
+    buckets=(1, 5, 15, 30, 60, 120, 300, 600, 1800, 3600, 7200),
+)
+CACHE_REFRESH_LAG_SECONDS = Histogram(
+    "cache_refresh_lag_seconds",
+    "Time from an entry going stale to its background refresh storing a new value",
+    ["layer"],
+    buckets=(1, 5, 15, 30, 60, 120, 300, 600, 1800, 3600, 7200),
+)
+DB_QUERIES_PER_REQUEST = Histogram(
+    "db_queries_per_request",
+    "SQL statements executed while handling a request",
+    ["route"],
+    buckets=(0, 1, 2, 3, 5, 8, 13, 21, 34, 55),
+)
+DB_POOL_CONNECTIONS = Gauge(
+    "db_pool_connections",
+    "Database connection pool usage for this worker",
+    ["state"],
+)
+MODEL_INFO = Gauge(
+    "recommendation_model_info",
+    "Model version currently served (value is always 1)",
+    ["model", "version"],
+)
+MODEL_AGE_SECONDS = Gauge(
+    "recommendation_model_age_seconds",
+    "Seconds since the served model was published",
+    ["model"],
+)
+RETRAIN_DURATION_SECONDS = Gauge(
+    "recommendation_retrain_duration_seconds",
+    "Duration of the last successful retraining run",
+    ["mode"],
+)
+RETRAIN_COMPLETED_TIMESTAMP = Gauge(
+    "recommendation_retrain_completed_timestamp_seconds",
+    "Unix time the last successful retraining run finished",
+    ["mode"],
+)
+
+# Per-request SQL statement counter; tasks spawned by the request share the same list
+_db_queries: contextvars.ContextVar[Optional[List[int]]] = contextvars.ContextVar("db_queries", default=None)
+
+
+@event.listens_for(engine.sync_engine, "before_cursor_execute")
+def _count_query(conn, cursor, statement, parameters, context, executemany):
+    counter = _db_queries.get()
+    if counter is not None:
+        counter[0] += 1
+
+
+def start_query_count() -> contextvars.Token:
+    return _db_queries.set([0])
+
+
+def finish_query_count(token: contextvars.Token, route: str):
+    counter = _db_queries.get()
+    _db_queries.reset(token)
+    if counter is not None:
+        DB_QUERIES_PER_REQUEST.labels(route).observe(counter[0])
+
+
+@contextmanager
+def stage_timer(stage: str):
+    """Record how long the enclosed block takes as one recommendation pipeline stage"""
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        STAGE_SECONDS.labels(stage).observe(time.perf_counter() - started)
+
+
+def peak_rss_mb() -> float:
+    """Peak resident memory of this process so far, in MB"""
+    # ru_maxrss is reported in kilobytes on Linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def observe_models(registries: Dict[str, ModelRegistry]):
+    """Refresh model version and age gauges at scrape time"""
+    MODEL_INFO.clear()
+    for name, registry in registries.items():
+        snapshot = registry.snapshot()
+        if snapshot is None:
+            continue
+        MODEL_INFO.labels(name, snapshot.version).set(1)
+        MODEL_AGE_SECONDS.labels(name).set(time.time() - snapshot.published_at)
+
+
+def observe_pool():
+    stats = get_pool_stats()
+    DB_POOL_CONNECTIONS.labels("checked_out").set(stats["checked_out"])
+    DB_POOL_CONNECTIONS.labels("checked_in").set(stats["checked_in"])
+    DB_POOL_CONNECTIONS.labels("overflow").set(stats["overflow"])
+
+
+async def observe_retrain_runs(redis_client):
+    """Copy the last retraining runs recorded by the Celery worker into gauges"""
+    for mode in ("full", "incremental"):
+        run = await redis_client.get(RETRAIN_RUN_KEY.format(mode=mode))
+        if run:
+            run = json.loads(run)
+            RETRAIN_DURATION_SECONDS.labels(mode).set(run["seconds"])
+            RETRAIN_COMPLETED_TIMESTAMP.labels(mode).set(run["completed_at"])
@@ -0,0 +1,12 @@
+from sqlalchemy import Column, String, Date, Integer, DateTime
+from sqlalchemy.sql import func
+from app.core.database import Base
+
+class ShopDailyOrders(Base):
+    """Orders per shop per UTC day, kept up to date by app.tasks.shop_rollups"""
+    __tablename__ = "shop_daily_orders"
+
+    shop_id = Column(String, primary_key=True)
+    day = Column(Date, primary_key=True, index=True)
+    order_count = Column(Integer, nullable=False, default=0)
+    updated_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now())
@@ -1,4 +1,4 @@
-from sqlalchemy import Column, String, DateTime, Text
+from sqlalchemy import Column, String, DateTime, Text, Integer
 from sqlalchemy.sql import func
 from app.core.database import Base
 
@@ -9,4 +9,34 @@ class UserEvent(Base):
     user_id = Column(String, nullable=False, index=True)
     event_type = Column(String, nullable=False, index=True)  # view, click, purchase, etc
     event_data = Column(Text, nullable=False)  # JSON string
-    created_at = Column(DateTime(timezone=True), server_default=func.now(), index=True)
\ No newline at end of file
+    # Hot fields copied out of event_data at write time, so queries don't parse JSON
+    product_id = Column(String, nullable=True, index=True)
+    shop_id = Column(String, nullable=True, index=True)
+    quantity = Column(Integer, nullable=True)
+    created_at = Column(DateTime(timezone=True), server_default=func.now(), index=True)
+
+# Columns added after user_events was first created; create_all doesn't alter existing tables,
+# so create_tables() runs these at startup. Their indexes are built offline by
+# app.tasks.backfill_user_events, since building them on a large table is slow.
+ADDED_COLUMNS = [
+    "ALTER TABLE user_events ADD COLUMN IF NOT EXISTS product_id VARCHAR",
+    "ALTER TABLE user_events ADD COLUMN IF NOT EXISTS shop_id VARCHAR",
+    "ALTER TABLE user_events ADD COLUMN IF NOT EXISTS quantity INTEGER",
+]
+
+
+def extract_event_fields(event_data: dict) -> dict:
+    """Typed product_id/shop_id/quantity columns from an event's JSON payload"""
+    product_id = event_data.get('product_id')
+    shop_id = event_data.get('shop_id')
+    quantity = event_data.get('quantity')
+    try:
+        quantity = int(quantity) if quantity is not None else None
+    except (TypeError, ValueError):
+        quantity = None
+
+    return {
+        'product_id': str(product_id) if product_id else None,
+        'shop_id': str(shop_id) if shop_id else None,
+        'quantity': quantity,
+    }
@@ -1,5 +1,5 @@
 from pydantic import BaseModel
-from typing import Optional, Dict, Any
+from typing import Optional, Dict, Any, List
 from datetime import datetime
 
 class RecommendationResponse(BaseModel):
@@ -11,12 +11,20 @@ class RecommendationResponse(BaseModel):
     image_url: Optional[str]
     score: float
     reason: str  # Why this product was recommended
+    sources: List[str] = []  # Candidate sources that contributed to the score
+
+class RecommendationBatchRequest(BaseModel):
+    user_ids: List[str]
+    limit: int = 10
 
 class UserEventCreate(BaseModel):
     user_id: str
     event_type: str  # view, click, purchase, add_to_cart, etc
     event_data: Dict[str, Any]  # JSON data about the event
 
+class UserEventBatch(BaseModel):
+    events: List[UserEventCreate]
+
 class TrendingProduct(BaseModel):
     product_id: str
     product_name: str
@@ -0,0 +1,55 @@
+from typing import Dict, List, Tuple
+
+import numpy as np
+
+
+def blend_candidates(
+    candidates_by_source: Dict[str, Dict[str, Dict]],
+    weights: Dict[str, float],
+    limit: int
+) -> List[Tuple[str, float, str, List[str]]]:
+    """
+    Blend per-source candidate scores into the top `limit` products.
+
+    Candidates are aligned into a (candidate x source) score matrix, weighted in one step
+    and selected with argpartition. Each result is (product_id, score, reason, sources),
+    best first; the reason comes from the source contributing most to the item's score.
+    """
+    sources = [source for source, candidates in candidates_by_source.items() if candidates]
+    if not sources or limit <= 0:
+        return []
+
+    ids_per_source = [list(candidates_by_source[source]) for source in sources]
+    all_ids = np.array([product_id for ids in ids_per_source for product_id in ids], dtype=object)
+    product_ids, inverse = np.unique(all_ids, return_inverse=True)
+
+    scores = np.zeros((len(product_ids), len(sources)), dtype=np.float64)
+    present = np.zeros_like(scores, dtype=bool)
+    offset = 0
+    for column, (source, ids) in enumerate(zip(sources, ids_per_source)):
+        rows = inverse[offset:offset + len(ids)]
+        scores[rows, column] = [candidates_by_source[source][product_id]['score'] for product_id in ids]
+        present[rows, column] = True
+        offset += len(ids)
+
+    weighted = scores * np.array([weights.get(source, 0.0) for source in sources])
+    totals = weighted.sum(axis=1)
+
+    if len(totals) > limit:
+        top = np.argpartition(-totals, limit - 1)[:limit]
+    else:
+        top = np.arange(len(totals))
+    top = top[np.argsort(-totals[top], kind='stable')]
+
+    # Sources that didn't return an item can't win its reason
+    winners = np.where(present[top], weighted[top], -np.inf).argmax(axis=1)
+
+    return [
+        (
+            product_ids[row],
+            float(totals[row]),
+            candidates_by_source[sources[winner]][product_ids[row]]['reason'],
+            [source for source, found in zip(sources, present[row]) if found]
+        )
+        for row, winner in zip(top, winners)
+    ]
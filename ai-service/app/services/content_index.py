@@ -0,0 +1,91 @@
+from typing import List, Optional, Tuple
+
+import numpy as np
+
+from app.services.neighbor_index import load_versioned_arrays, save_versioned_arrays
+
+# Users scored per matrix product, bounding the (products x users) score block
+USER_BLOCK = 64
+
+
+class ContentIndex:
+    """
+    L2-normalized product feature vectors, one float32 row per product.
+    ids is sorted so lookups are a binary search; vectors[i] describes ids[i].
+    A user's history is summarized as the mean of its vectors and scored against the whole
+    catalogue with one matrix product.
+    """
+
+    def __init__(self, ids: np.ndarray, vectors: np.ndarray, version: Optional[str] = None):
+        self.ids = ids
+        self.vectors = vectors
+        self.version = version
+
+    @classmethod
+    def from_arrays(cls, ids: np.ndarray, vectors: np.ndarray) -> 'ContentIndex':
+        ids = np.asarray(ids).astype(str)
+        order = np.argsort(ids, kind='stable')
+        return cls(ids[order], np.ascontiguousarray(vectors[order], dtype=np.float32))
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    def _positions(self, ids: List[str]) -> np.ndarray:
+        ids = np.asarray(list(ids), dtype=str)
+        if not len(ids) or not len(self.ids):
+            return np.empty(0, dtype=np.int64)
+        positions = np.minimum(np.searchsorted(self.ids, ids), len(self.ids) - 1)
+        return positions[self.ids[positions] == ids]
+
+    def save(self, path: str):
+        save_versioned_arrays(path, {'ids': self.ids, 'vectors': self.vectors}, {
+            'dims': int(self.vectors.shape[1]),
+        })
+
+    @classmethod
+    def load(cls, path: str) -> 'ContentIndex':
+        (ids, vectors), header = load_versioned_arrays(path, ('ids', 'vectors'))
+        return cls(ids, vectors, version=header['version'])
+
+    def recommend(
+        self,
+        history: List[str],
+        exclude: Optional[set] = None,
+        limit: int = 20
+    ) -> List[Tuple[str, float]]:
+        """Products most similar to the history as a whole, best first, with cosine scores"""
+        return self.recommend_many([history], [exclude], limit)[0]
+
+    def recommend_many(
+        self,
+        histories: List[List[str]],
+        excludes: List[Optional[set]],
+        limit: int = 20
+    ) -> List[List[Tuple[str, float]]]:
+        """recommend() for many users, scoring USER_BLOCK users per matrix product"""
+        results: List[List[Tuple[str, float]]] = [[] for _ in histories]
+        rows_per_user = [self._positions(history) for history in histories]
+        users = [i for i, rows in enumerate(rows_per_user) if len(rows)]
+
+        for start in range(0, len(users), USER_BLOCK):
+            block = users[start:start + USER_BLOCK]
+            profiles = np.stack([self.vectors[rows_per_user[i]].mean(axis=0) for i in block])
+            norms = np.linalg.norm(profiles, axis=1, keepdims=True)
+            profiles /= np.maximum(norms, 1e-12)
+
+            # (products x users) cosine scores in one product
+            scores = self.vectors @ profiles.T
+
+            for column, i in enumerate(block):
+                user_scores = scores[:, column]
+                excluded = np.union1d(rows_per_user[i], self._positions(excludes[i] or ()))
+                user_scores[excluded] = -np.inf
+
+                k = min(limit, len(user_scores) - len(excluded))
+                if k <= 0:
+                    continue
+                top = np.argpartition(-user_scores, k - 1)[:k]
+                top = top[np.argsort(-user_scores[top])]
+                results[i] = [(str(self.ids[p]), float(user_scores[p])) for p in top if user_scores[p] > 0]
+
+        return results
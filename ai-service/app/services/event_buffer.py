@@ -0,0 +1,127 @@
+import asyncio
+import json
+import uuid
+from typing import Any, Dict, List, Optional
+
+from sqlalchemy import insert
+
+from app.models.user_events import UserEvent, extract_event_fields
+from app.schemas.recommendation import UserEventCreate
+
+
+class EventBufferFull(Exception):
+    """Raised when events can't be accepted because the buffer is full and cannot be drained"""
+
+
+class EventBuffer:
+    """
+    In-process write-behind buffer for user events.
+
+    Events are flushed with multi-row inserts once flush_size events are waiting or every
+    flush_interval seconds, whichever comes first. The buffer never holds more than max_size
+    events: when full, the caller waits for a flush, and gets EventBufferFull if the flush
+    could not make room (e.g. the database is down).
+
+    Shutdown policy: stop() performs a final flush bounded by shutdown_timeout seconds.
+    Events that still could not be written are dropped and reported in the log.
+    """
+
+    def __init__(
+        self,
+        session_factory,
+        max_size: int,
+        flush_size: int,
+        flush_interval: float,
+        shutdown_timeout: float
+    ):
+        self.session_factory = session_factory
+        self.max_size = max_size
+        self.flush_size = flush_size
+        self.flush_interval = flush_interval
+        self.shutdown_timeout = shutdown_timeout
+
+        self._pending: List[Dict[str, Any]] = []
+        self._flush_lock = asyncio.Lock()
+        self._flush_task: Optional[asyncio.Task] = None
+        self._timer_task: Optional[asyncio.Task] = None
+
+        self.flushed_count = 0
+        self.dropped_count = 0
+
+    def __len__(self) -> int:
+        return len(self._pending)
+
+    async def add(self, events: List[UserEventCreate]):
+        """Queue events for writing"""
+        if len(self._pending) + len(events) > self.max_size:
+            await self.flush()
+            if len(self._pending) + len(events) > self.max_size:
+                raise EventBufferFull(f"Event buffer full ({len(self._pending)} events pending)")
+
+        # created_at is left to the database default, so it is set when the row is written:
+        # rows held back by a failed flush still land after the retraining watermark
+        self._pending.extend({
+            'id': str(uuid.uuid4()),
+            'user_id': event.user_id,
+            'event_type': event.event_type,
+            'event_data': json.dumps(event.event_data),
+            **extract_event_fields(event.event_data),
+        } for event in events)
+
+        # Size threshold: start a flush without making this request wait for it
+        if len(self._pending) >= self.flush_size and (self._flush_task is None or self._flush_task.done()):
+            self._flush_task = asyncio.create_task(self.flush())
+
+    async def flush(self):
+        """Write every pending event, flush_size rows per INSERT"""
+        async with self._flush_lock:
+            if not self._pending:
+                return
+
+            # Swap the list out so new events can keep arriving during the write
+            rows, self._pending = self._pending, []
+            try:
+                async with self.session_factory() as session:
+                    for start in range(0, len(rows), self.flush_size):
+                        await session.execute(insert(UserEvent), rows[start:start + self.flush_size])
+                    await session.commit()
+                self.flushed_count += len(rows)
+            except asyncio.CancelledError:
+                self._pending = rows + self._pending
+                raise
+            except Exception as e:
+                # Put the rows back for the next attempt, as far as the size bound allows
+                room = max(0, self.max_size - len(self._pending))
+                self._pending = rows[:room] + self._pending
+                self.dropped_count += len(rows) - min(room, len(rows))
+                print(f"Error flushing {len(rows)} events: {e}")
+
+    async def _flush_periodically(self):
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            await self.flush()
+
+    def start(self):
+        """Start the time-based flush loop"""
+        if self._timer_task is None:
+            self._timer_task = asyncio.create_task(self._flush_periodically())
+
+    async def stop(self):
+        """Stop the flush loop and write what is still buffered, within the shutdown timeout"""
+        if self._timer_task is not None:
+            self._timer_task.cancel()
+            try:
+                await self._timer_task
+            except asyncio.CancelledError:
+                pass
+            self._timer_task = None
+
+        try:
+            await asyncio.wait_for(self.flush(), timeout=self.shutdown_timeout)
+        except asyncio.TimeoutError:
+            print(f"Event flush timed out after {self.shutdown_timeout}s during shutdown")
+
+        if self._pending:
+            self.dropped_count += len(self._pending)
+            print(f"Dropping {len(self._pending)} unflushed events at shutdown")
+            self._pending = []
@@ -0,0 +1,129 @@
+import asyncio
+import os
+import threading
+import time
+from datetime import datetime, timezone
+from typing import Any, Callable, Dict, Optional, Tuple
+
+from app.core.config import settings
+from app.services.content_index import ContentIndex
+from app.services.neighbor_index import NeighborIndex
+
+USER_INDEX_FILENAME = 'user_neighbors.json'
+ITEM_INDEX_FILENAME = 'item_neighbors.json'
+CONTENT_INDEX_FILENAME = 'content_vectors.json'
+
+
+class ModelSnapshot:
+    """A loaded model artifact together with its version information"""
+
+    def __init__(self, data: Any, signature: Tuple[int, int], load_seconds: float):
+        self.data = data
+        self.signature = signature
+        # Artifacts that carry their own version stamp report it; otherwise fall back to the file mtime
+        self.version = getattr(data, 'version', None) or datetime.fromtimestamp(
+            signature[0] / 1e9, tz=timezone.utc
+        ).strftime('%Y%m%d%H%M%S')
+        self.loaded_at = datetime.now(timezone.utc)
+        self.load_seconds = load_seconds
+
+    @property
+    def published_at(self) -> float:
+        """Unix time the artifact was written by the retraining job"""
+        return self.signature[0] / 1e9
+
+
+class ModelRegistry:
+    """
+    Process-wide holder for a collaborative filtering model artifact.
+    The artifact is loaded once and swapped atomically whenever a newer file is detected.
+    """
+
+    def __init__(self, model_dir: str, filename: str, loader: Callable[[str], Any] = NeighborIndex.load):
+        self.path = os.path.join(model_dir, filename)
+        self._loader = loader
+        self._snapshot: Optional[ModelSnapshot] = None
+        self._load_lock = threading.Lock()
+        self._watch_task: Optional[asyncio.Task] = None
+
+    def get(self) -> Optional[Any]:
+        """Return the current model, or None if none is loaded"""
+        snapshot = self._snapshot
+        return snapshot.data if snapshot else None
+
+    def snapshot(self) -> Optional[ModelSnapshot]:
+        """Return the current model with its version information, or None if none is loaded"""
+        return self._snapshot
+
+    def _file_signature(self) -> Optional[Tuple[int, int]]:
+        try:
+            stat = os.stat(self.path)
+        except FileNotFoundError:
+            return None
+        return (stat.st_mtime_ns, stat.st_size)
+
+    def reload_if_changed(self) -> bool:
+        """Load the artifact if it differs from the one in memory. Returns True when a new model was swapped in."""
+        with self._load_lock:
+            signature = self._file_signature()
+            current = self._snapshot
+            if signature is None or (current and current.signature == signature):
+                return False
+
+            started = time.perf_counter()
+            data = self._loader(self.path)
+            snapshot = ModelSnapshot(data, signature, time.perf_counter() - started)
+            # Single reference assignment, so readers always see either the old or the new model
+            self._snapshot = snapshot
+
+        print(f"Loaded {os.path.basename(self.path)} version {snapshot.version} in {snapshot.load_seconds:.3f}s")
+        return True
+
+    def status(self) -> Dict[str, Any]:
+        """Describe the model currently being served"""
+        snapshot = self._snapshot
+        if not snapshot:
+            return {'loaded': False, 'path': self.path}
+
+        return {
+            'loaded': True,
+            'path': self.path,
+            'version': snapshot.version,
+            'loaded_at': snapshot.loaded_at.isoformat(),
+            'load_seconds': round(snapshot.load_seconds, 4),
+            'entries': len(snapshot.data),
+        }
+
+    async def _watch(self, interval: float):
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                await asyncio.to_thread(self.reload_if_changed)
+            except Exception as e:
+                print(f"Error reloading {self.path}: {e}")
+
+    def start_watching(self, interval: float):
+        """Poll for new artifacts written by the retraining task"""
+        if self._watch_task is None:
+            self._watch_task = asyncio.create_task(self._watch(interval))
+
+    async def stop_watching(self):
+        if self._watch_task is not None:
+            self._watch_task.cancel()
+            try:
+                await self._watch_task
+            except asyncio.CancelledError:
+                pass
+            self._watch_task = None
+
+
+user_index_registry = ModelRegistry(settings.model_path, USER_INDEX_FILENAME)
+item_index_registry = ModelRegistry(settings.model_path, ITEM_INDEX_FILENAME)
+content_index_registry = ModelRegistry(settings.model_path, CONTENT_INDEX_FILENAME, loader=ContentIndex.load)
+
+# Every served model by name, for loading, watching and reporting
+model_registries = {
+    'user_neighbors': user_index_registry,
+    'item_neighbors': item_index_registry,
+    'content_vectors': content_index_registry,
+}
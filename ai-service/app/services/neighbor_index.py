@@ -0,0 +1,169 @@
+import json
+import os
+import shutil
+from datetime import datetime, timezone
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+# Bump when the on-disk layout changes; readers refuse formats they don't know
+FORMAT_VERSION = 1
+# Published versions kept on disk, so workers still mapping an older one are unaffected
+KEEP_VERSIONS = 3
+
+
+class NeighborIndex:
+    """
+    Top-K neighbor lists (users or items) stored as compact arrays.
+    ids is sorted so lookups are a binary search; row i of neighbors/scores holds the K most
+    similar entries to ids[i], as positions into ids. Unused slots are -1.
+
+    On disk an index is a header file pointing at a version directory of .npy arrays,
+    which load() memory-maps so every worker shares the same page cache.
+    """
+
+    def __init__(self, ids: np.ndarray, neighbors: np.ndarray, scores: np.ndarray, version: Optional[str] = None):
+        self.ids = ids
+        self.neighbors = neighbors
+        self.scores = scores
+        self.version = version
+
+    @classmethod
+    def from_arrays(cls, ids: np.ndarray, neighbors: np.ndarray, scores: np.ndarray) -> 'NeighborIndex':
+        """Build an index from arrays in any id order, sorting rows by id"""
+        ids = np.asarray(ids).astype(str)
+        order = np.argsort(ids, kind='stable')
+        new_positions = np.empty(len(ids), dtype=np.int32)
+        new_positions[order] = np.arange(len(ids), dtype=np.int32)
+
+        neighbors = neighbors[order]
+        neighbors = np.where(neighbors >= 0, new_positions[np.maximum(neighbors, 0)], -1).astype(np.int32)
+        return cls(ids[order], neighbors, scores[order].astype(np.float32))
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    def __contains__(self, id_: str) -> bool:
+        return self._position(id_) is not None
+
+    def _position(self, id_: str) -> Optional[int]:
+        position = int(np.searchsorted(self.ids, id_))
+        if position < len(self.ids) and self.ids[position] == id_:
+            return position
+        return None
+
+    def _positions(self, ids: List[str]) -> np.ndarray:
+        positions = [self._position(id_) for id_ in ids]
+        return np.array([p for p in positions if p is not None], dtype=np.int64)
+
+    def save(self, path: str):
+        """
+        Publish a new version: write the arrays into a fresh version directory, then
+        atomically replace the header that points at it.
+        """
+        save_versioned_arrays(path, {name: getattr(self, name) for name in ('ids', 'neighbors', 'scores')}, {
+            'k': int(self.neighbors.shape[1]),
+        })
+
+    @classmethod
+    def load(cls, path: str) -> 'NeighborIndex':
+        """Memory-map the version the header at path points to"""
+        arrays, header = load_versioned_arrays(path, ('ids', 'neighbors', 'scores'))
+        return cls(*arrays, version=header['version'])
+
+    def neighbors_of(self, id_: str, limit: int = 10) -> List[Tuple[str, float]]:
+        """Most similar entries to id_, best first"""
+        row = self._position(id_)
+        if row is None:
+            return []
+
+        neighbors = self.neighbors[row][:limit]
+        scores = self.scores[row][:limit]
+        return [(str(self.ids[n]), float(s)) for n, s in zip(neighbors, scores) if n >= 0]
+
+    def recommend(
+        self,
+        history: List[str],
+        exclude: Optional[set] = None,
+        limit: int = 20
+    ) -> List[Tuple[str, float]]:
+        """
+        Score entries by their summed similarity to the entries in history.
+        Scores are averaged over the history entries found in the index, so they stay within 0-1.
+        """
+        rows = self._positions(history)
+        if not len(rows):
+            return []
+
+        neighbors = self.neighbors[rows].ravel()
+        scores = self.scores[rows].ravel()
+        valid = neighbors >= 0
+        candidates, inverse = np.unique(neighbors[valid], return_inverse=True)
+        totals = np.bincount(inverse, weights=scores[valid]) / len(rows)
+
+        excluded = np.union1d(rows, self._positions(list(exclude or ())))
+        keep = ~np.isin(candidates, excluded)
+        candidates, totals = candidates[keep], totals[keep]
+        if len(candidates) == 0:
+            return []
+
+        if len(candidates) > limit:
+            top = np.argpartition(-totals, limit - 1)[:limit]
+        else:
+            top = np.arange(len(candidates))
+        top = top[np.argsort(-totals[top])]
+
+        return [(str(self.ids[candidates[i]]), float(totals[i])) for i in top]
+
+
+def save_versioned_arrays(path: str, arrays: Dict[str, np.ndarray], extra_header: Optional[dict] = None):
+    """
+    Write arrays as .npy files into a new version directory next to path, then atomically
+    replace the JSON header at path so readers switch to the new version in one step.
+    """
+    version = datetime.now(timezone.utc).strftime('%Y%m%dT%H%M%S%f')
+    base_dir = os.path.dirname(path)
+    name = os.path.splitext(os.path.basename(path))[0]
+    version_dir = f"{name}-{version}"
+    os.makedirs(os.path.join(base_dir, version_dir))
+
+    for array_name, array in arrays.items():
+        np.save(os.path.join(base_dir, version_dir, f"{array_name}.npy"), np.ascontiguousarray(array))
+
+    header = {
+        'format': FORMAT_VERSION,
+        'version': version,
+        'directory': version_dir,
+        'entries': len(next(iter(arrays.values()))),
+        **(extra_header or {}),
+    }
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, 'w') as f:
+        json.dump(header, f)
+    os.replace(tmp_path, path)
+
+    _remove_old_versions(base_dir, name, keep=KEEP_VERSIONS)
+
+
+def load_versioned_arrays(path: str, array_names: Tuple[str, ...]) -> Tuple[List[np.ndarray], dict]:
+    """Memory-map the arrays of the version the header at path points to"""
+    with open(path) as f:
+        header = json.load(f)
+    if header.get('format') != FORMAT_VERSION:
+        raise ValueError(f"Unsupported model format {header.get('format')} in {path}")
+
+    version_dir = os.path.join(os.path.dirname(path), header['directory'])
+    arrays = [
+        np.load(os.path.join(version_dir, f"{array_name}.npy"), mmap_mode='r', allow_pickle=False)
+        for array_name in array_names
+    ]
+    return arrays, header
+
+
+def _remove_old_versions(base_dir: str, name: str, keep: int):
+    versions = sorted(
+        entry for entry in os.listdir(base_dir)
+        if entry.startswith(f"{name}-") and os.path.isdir(os.path.join(base_dir, entry))
+    )
+    for old in versions[:-keep]:
+        shutil.rmtree(os.path.join(base_dir, old), ignore_errors=True)
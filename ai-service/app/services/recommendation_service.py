@@ -1,15 +1,33 @@
-import redis
+import asyncio
+import redis.asyncio as redis
 import json
 import numpy as np
 import pandas as pd
-from typing import List, Optional, Dict, Any
+from typing import List, Optional, Dict, Any, Awaitable, Callable, NamedTuple, Tuple
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy import text
 import os
-import pickle
-from datetime import datetime, timedelta
+import time
+from collections import defaultdict
+from datetime import datetime, timedelta, timezone
 
 from app.core.config import settings
+from app.core.database import async_session
+from app.core.metrics import (
+    CACHE_REFRESH_LAG_SECONDS,
+    CACHE_REQUESTS,
+    CACHE_STALE_AGE_SECONDS,
+    CANDIDATE_SOURCE_FAILURES,
+    stage_timer,
+)
+from app.services.blending import blend_candidates
+from app.services.event_buffer import EventBuffer
+from app.services.geo import encode_geohash, geohash_center
+from app.services.neighbor_index import NeighborIndex
+from app.services.shop_index import ShopSpatialIndex
+from app.services.single_flight import SingleFlight
+from app.services.trending import GLOBAL_SCOPE, TrendingCounters
+from app.services.model_registry import content_index_registry, user_index_registry, item_index_registry
 from app.schemas.recommendation import (
     RecommendationResponse,
     UserEventCreate,
@@ -17,12 +35,194 @@ from app.schemas.recommendation import (
     PopularShop
 )
 
+# Fixed queries are built once, so SQLAlchemy reuses their compiled form and each pooled
+# connection reuses its prepared statement
+USER_PROFILE_QUERY = text("""
+    SELECT
+        u.latitude, u.longitude,
+        array_agg(DISTINCT p.category) as preferred_categories,
+        array_agg(DISTINCT p.id) as purchased_products,
+        COUNT(o.id) as total_orders
+    FROM users u
+    LEFT JOIN orders o ON u.id = o.user_id
+    LEFT JOIN order_items oi ON o.id = oi.order_id
+    LEFT JOIN products p ON oi.product_id = p.id
+    WHERE u.id = :user_id
+    GROUP BY u.id, u.latitude, u.longitude
+""")
+
+SIMILAR_USER_PURCHASES_QUERY = text("""
+    SELECT DISTINCT p.id, p.name, :score as similarity_score
+    FROM orders o
+    JOIN order_items oi ON o.id = oi.order_id
+    JOIN products p ON oi.product_id = p.id
+    WHERE o.user_id = :similar_user
+    AND p.id NOT IN (
+        SELECT p2.id
+        FROM orders o2
+        JOIN order_items oi2 ON o2.id = oi2.order_id
+        JOIN products p2 ON oi2.product_id = p2.id
+        WHERE o2.user_id = :user_id
+    )
+    LIMIT 20
+""")
+
+PURCHASE_HISTORY_QUERY = text("""
+    SELECT oi.product_id
+    FROM orders o
+    JOIN order_items oi ON o.id = oi.order_id
+    WHERE o.user_id = :user_id
+    GROUP BY oi.product_id
+    ORDER BY MAX(o.created_at) DESC
+    LIMIT 200
+""")
+
+CATEGORY_PRODUCTS_QUERY = text("""
+    SELECT p.id, p.name, p.category,
+           CASE WHEN p.category = ANY(:categories) THEN 0.8 ELSE 0.3 END as category_score
+    FROM products p
+    WHERE p.category = ANY(:categories)
+    AND p.id != ALL(:purchased_products)
+    AND p.is_active = true
+    ORDER BY category_score DESC, p.average_rating DESC
+    LIMIT 30
+""")
+
+PRODUCTS_INFO_QUERY = text("""
+    SELECT p.id, p.name, s.name as shop_name, p.price, p.discount_price, p.image_url
+    FROM products p
+    JOIN shops s ON p.shop_id = s.id
+    WHERE p.id = ANY(:ids)
+""")
+
+USER_PROFILES_QUERY = text("""
+    SELECT
+        u.id, u.latitude, u.longitude,
+        array_agg(DISTINCT p.category) as preferred_categories,
+        array_agg(DISTINCT p.id) as purchased_products
+    FROM users u
+    LEFT JOIN orders o ON u.id = o.user_id
+    LEFT JOIN order_items oi ON o.id = oi.order_id
+    LEFT JOIN products p ON oi.product_id = p.id
+    WHERE u.id = ANY(:user_ids)
+    GROUP BY u.id, u.latitude, u.longitude
+""")
+
+PURCHASE_HISTORIES_QUERY = text("""
+    SELECT user_id, product_id
+    FROM (
+        SELECT o.user_id, oi.product_id,
+               ROW_NUMBER() OVER (PARTITION BY o.user_id ORDER BY MAX(o.created_at) DESC) as position
+        FROM orders o
+        JOIN order_items oi ON o.id = oi.order_id
+        WHERE o.user_id = ANY(:user_ids)
+        GROUP BY o.user_id, oi.product_id
+    ) history
+    WHERE position <= 200
+    ORDER BY user_id, position
+""")
+
+# Extra headroom per category so excluding a user's purchases still leaves enough
+TOP_CATEGORY_PRODUCTS_QUERY = text("""
+    SELECT category, id, rating
+    FROM (
+        SELECT p.category, p.id, COALESCE(p.average_rating, 0) as rating,
+               ROW_NUMBER() OVER (PARTITION BY p.category ORDER BY p.average_rating DESC NULLS LAST) as position
+        FROM products p
+        WHERE p.category = ANY(:categories)
+        AND p.is_active = true
+    ) ranked
+    WHERE position <= 60
+""")
+
+POPULAR_SHOPS_QUERY = text("""
+    SELECT s.id, s.name,
+           COALESCE(SUM(r.order_count), 0) as order_count,
+           COALESCE(s.average_rating, 0) as average_rating
+    FROM shops s
+    LEFT JOIN shop_daily_orders r ON r.shop_id = s.id AND r.day >= CAST(:since_day AS date)
+    WHERE s.id = ANY(:shop_ids)
+    AND s.is_open = true
+    GROUP BY s.id, s.name, s.average_rating
+    ORDER BY order_count DESC, average_rating DESC
+    LIMIT :limit
+""")
+
+class CachedValue(NamedTuple):
+    """A computed value that should be cached with its own TTLs instead of the layer's"""
+    value: Any
+    soft_ttl: int
+    hard_ttl: int
+
 class RecommendationService:
+    """
+    Long-lived service shared by every request in a worker.
+    Created once at startup and stored on app.state.recommendation_service.
+    """
+
     def __init__(self):
-        self.redis_client = redis.Redis.from_url(settings.redis_url)
+        # Bounded pool shared by all requests; callers wait for a free connection instead of opening new ones
+        self.redis_pool = redis.BlockingConnectionPool.from_url(
+            settings.redis_url,
+            max_connections=settings.redis_max_connections,
+            timeout=settings.redis_pool_timeout_seconds
+        )
+        self.redis_client = redis.Redis(connection_pool=self.redis_pool)
         self.model_path = settings.model_path
         os.makedirs(self.model_path, exist_ok=True)
 
+        # Candidate sources return 0-1 scores; these weights blend them
+        self.source_weights = {
+            'collaborative': settings.collaborative_weight,
+            'content': settings.content_weight,
+            'location': settings.location_weight,
+            'trending': settings.trending_weight,
+        }
+
+        self.single_flight = SingleFlight(
+            self.redis_client,
+            lock_ttl=settings.cache_lock_ttl_seconds,
+            wait_seconds=settings.cache_lock_wait_seconds,
+            poll_interval=settings.cache_lock_poll_seconds
+        )
+
+        # Hit/stale/miss counters per cache layer, for this worker
+        self.cache_stats: Dict[str, Dict[str, int]] = defaultdict(lambda: {'hits': 0, 'stale': 0, 'misses': 0})
+        # Background refreshes of stale entries, kept referenced until they finish
+        self._refresh_tasks = set()
+
+        self.shop_index = ShopSpatialIndex(async_session, settings.shop_index_refresh_seconds)
+        self.trending = TrendingCounters(
+            self.redis_client,
+            self.shop_index,
+            geohash_precision=settings.trending_geohash_precision,
+            window_hours=settings.trending_window_hours,
+            half_life_hours=settings.trending_half_life_hours,
+            max_products=settings.trending_max_products
+        )
+
+        self.event_buffer = EventBuffer(
+            async_session,
+            max_size=settings.event_buffer_max_size,
+            flush_size=settings.event_flush_size,
+            flush_interval=settings.event_flush_interval_seconds,
+            shutdown_timeout=settings.event_shutdown_flush_timeout_seconds
+        )
+
+    async def start(self):
+        """Start background work; called from the startup hook"""
+        await self.shop_index.start()
+        self.event_buffer.start()
+
+    async def close(self):
+        """Flush buffered events and release pooled Redis connections"""
+        await self.shop_index.stop()
+        await self.event_buffer.stop()
+        for task in list(self._refresh_tasks):
+            task.cancel()
+        await self.redis_client.aclose()
+        await self.redis_pool.disconnect()
+
     async def get_recommendations(
         self,
         user_id: str,
@@ -33,88 +233,152 @@ class RecommendationService:
     ) -> List[RecommendationResponse]:
         """
         Get hybrid recommendations for a user
-        Score = 0.4 × Collaborative Filtering + 0.3 × Content Similarity + 0.2 × Location Boost + 0.1 × Trending Score
+        Score = weighted sum of Collaborative Filtering, Content Similarity, Location Boost and Trending Score
+        (0.4 / 0.3 / 0.2 / 0.1 by default, see the *_weight settings)
         """
         try:
-            # Check cache first
-            cache_key = f"recommendations:{user_id}:{latitude or 0}:{longitude or 0}:{limit}"
-            cached_result = self.redis_client.get(cache_key)
-            if cached_result:
-                return json.loads(cached_result)
+            # Check cache first; the key includes the user's cache generation, so bumping it invalidates
+            # Location only enters the key as a coarse cell, so nearby requests share an entry
+            with stage_timer('cache_lookup'):
+                generation = await self._get_cache_generation(user_id)
+                cell = self._location_cell(latitude, longitude) or 'none'
+                cache_key = self._recommendations_cache_key(user_id, generation, cell, limit)
+                entry = await self._read_cache_entry(cache_key)
+
+            # Stale entries are returned at once and refreshed in the background; misses share one pipeline run
+            return await self._serve_cached(
+                'recommendations',
+                cache_key,
+                entry,
+                settings.recommendation_cache_ttl_seconds,
+                settings.recommendation_cache_hard_ttl_seconds,
+                lambda session: self._compute_recommendations(user_id, latitude, longitude, limit, session)
+            )
 
-            recommendations = []
+        except Exception as e:
+            print(f"Error getting recommendations: {e}")
+            # Return location-based recommendations as fallback
+            return await self._get_location_recommendations(latitude, longitude, limit, db)
 
-            # Get user preferences and history
-            user_profile = await self._get_user_profile(user_id, db)
+    async def _compute_recommendations(
+        self,
+        user_id: str,
+        latitude: Optional[float],
+        longitude: Optional[float],
+        limit: int,
+        db: AsyncSession
+    ) -> Any:
+        """
+        Run the candidate, blend and hydrate pipeline. A feed missing a candidate source is
+        returned as a CachedValue with the short partial TTL, so it is recomputed soon.
+        """
+        recommendations = []
+
+        # Run all candidate sources concurrently, each on its own pooled session
+        with stage_timer('candidates'):
+            candidates_by_source = await self._generate_candidates(user_id, latitude, longitude, limit)
+
+        # Weight, combine and select the top candidates in one vectorized pass
+        with stage_timer('blend'):
+            top_candidates = self._combine_recommendations(candidates_by_source, limit)
+
+        # Hydrate all selected products in one batch, then format in ranked order
+        with stage_timer('hydrate'):
+            products_info = await self._get_products_info([product_id for product_id, _, _, _ in top_candidates], db)
+        for product_id, score, reason, sources in top_candidates:
+            product_info = products_info.get(product_id)
+            if product_info:
+                recommendations.append(RecommendationResponse(
+                    product_id=product_id,
+                    product_name=product_info['name'],
+                    shop_name=product_info['shop_name'],
+                    price=product_info['price'],
+                    discount_price=product_info.get('discount_price'),
+                    image_url=product_info.get('image_url'),
+                    score=round(score, 3),
+                    reason=reason,
+                    sources=sources
+                ))
+
+        recommendations = [r.dict() for r in recommendations]
+        if len(candidates_by_source) < len(self.source_weights):
+            return CachedValue(
+                recommendations,
+                settings.partial_recommendation_cache_ttl_seconds,
+                settings.recommendation_cache_ttl_seconds
+            )
+        return recommendations
 
-            # Get collaborative filtering recommendations
-            cf_recommendations = await self._get_collaborative_recommendations(user_id, db)
+    async def _generate_candidates(
+        self,
+        user_id: str,
+        latitude: Optional[float],
+        longitude: Optional[float],
+        limit: int
+    ) -> Dict[str, Dict[str, Dict]]:
+        """
+        Run the candidate sources concurrently with a time budget per source.
+        Sources that time out or fail are left out of the blend.
+        """
+        sources = {
+            'collaborative': (
+                lambda db: self._get_collaborative_recommendations(user_id, db),
+                settings.collaborative_timeout_seconds
+            ),
+            'content': (
+                lambda db: self._get_content_candidates(user_id, db),
+                settings.content_timeout_seconds
+            ),
+            'location': (
+                lambda db: self._get_location_recommendations(latitude, longitude, limit * 2, db),
+                settings.location_timeout_seconds
+            ),
+            'trending': (
+                lambda db: self._get_trending_recommendations(self._trending_scope(latitude, longitude), limit * 2, db),
+                settings.trending_timeout_seconds
+            ),
+        }
 
-            # Get content-based recommendations
-            content_recommendations = await self._get_content_recommendations(user_profile, db)
+        results = await asyncio.gather(*(
+            self._run_candidate_source(name, source, timeout)
+            for name, (source, timeout) in sources.items()
+        ))
 
-            # Get location-based recommendations
-            location_recommendations = await self._get_location_recommendations(
-                latitude, longitude, limit * 2, db
-            )
+        return {name: result for name, result in zip(sources, results) if result is not None}
 
-            # Get trending products
-            trending_recommendations = await self._get_trending_recommendations(limit * 2, db)
+    async def _run_candidate_source(self, name: str, source, timeout: float) -> Optional[Dict[str, Dict]]:
+        """Run a single candidate source on a dedicated session, returning None if it misses its budget"""
+        try:
+            with stage_timer(f"source_{name}"):
+                async with async_session() as db:
+                    return await asyncio.wait_for(source(db), timeout=timeout)
+        except asyncio.TimeoutError:
+            CANDIDATE_SOURCE_FAILURES.labels(name, 'timeout').inc()
+            print(f"Candidate source '{name}' exceeded {timeout}s budget, skipping")
+        except Exception as e:
+            CANDIDATE_SOURCE_FAILURES.labels(name, 'error').inc()
+            print(f"Candidate source '{name}' failed: {e}")
+        return None
 
-            # Combine and score all recommendations
-            all_candidates = self._combine_recommendations(
-                cf_recommendations,
-                content_recommendations,
-                location_recommendations,
-                trending_recommendations
+    async def _get_content_candidates(self, user_id: str, db: AsyncSession) -> Dict[str, Dict]:
+        """Get content-based recommendations: products similar to the user's purchases, else their categories"""
+        content_index = content_index_registry.get()
+        if content_index:
+            result = await db.execute(PURCHASE_HISTORY_QUERY, {"user_id": user_id})
+            purchased = [row[0] for row in result]
+            # Similarity against the whole catalogue is one matrix product over the in-memory vectors
+            recommendations = self._score_similar_products(
+                content_index.recommend(purchased[:20], exclude=set(purchased), limit=30)
             )
+            if recommendations:
+                return recommendations
 
-            # Sort by score and limit
-            sorted_candidates = sorted(all_candidates.items(), key=lambda x: x[1]['score'], reverse=True)
-            top_candidates = sorted_candidates[:limit]
-
-            # Format response
-            for product_id, data in top_candidates:
-                product_info = await self._get_product_info(product_id, db)
-                if product_info:
-                    recommendations.append(RecommendationResponse(
-                        product_id=product_id,
-                        product_name=product_info['name'],
-                        shop_name=product_info['shop_name'],
-                        price=product_info['price'],
-                        discount_price=product_info.get('discount_price'),
-                        image_url=product_info.get('image_url'),
-                        score=round(data['score'], 3),
-                        reason=data['reason']
-                    ))
-
-            # Cache for 30 minutes
-            self.redis_client.setex(cache_key, 1800, json.dumps([r.dict() for r in recommendations]))
-
-            return recommendations
-
-        except Exception as e:
-            print(f"Error getting recommendations: {e}")
-            # Return location-based recommendations as fallback
-            return await self._get_location_recommendations(latitude, longitude, limit, db)
+        user_profile = await self._get_user_profile(user_id, db)
+        return await self._get_content_recommendations(user_profile, db)
 
     async def _get_user_profile(self, user_id: str, db: AsyncSession) -> Dict[str, Any]:
         """Get user profile including preferences and purchase history"""
-        query = text("""
-            SELECT
-                u.latitude, u.longitude,
-                array_agg(DISTINCT p.category) as preferred_categories,
-                array_agg(DISTINCT p.id) as purchased_products,
-                COUNT(o.id) as total_orders
-            FROM users u
-            LEFT JOIN orders o ON u.id = o.user_id
-            LEFT JOIN order_items oi ON o.id = oi.order_id
-            LEFT JOIN products p ON oi.product_id = p.id
-            WHERE u.id = :user_id
-            GROUP BY u.id, u.latitude, u.longitude
-        """)
-
-        result = await db.execute(query, {"user_id": user_id})
+        result = await db.execute(USER_PROFILE_QUERY, {"user_id": user_id})
         row = result.fetchone()
 
         if row:
@@ -136,36 +400,22 @@ class RecommendationService:
 
     async def _get_collaborative_recommendations(self, user_id: str, db: AsyncSession) -> Dict[str, Dict]:
         """Get collaborative filtering recommendations"""
-        # Load pre-computed similarity matrix if available
-        model_file = os.path.join(self.model_path, 'user_similarity.pkl')
-        if os.path.exists(model_file):
-            with open(model_file, 'rb') as f:
-                user_similarity = pickle.load(f)
-
+        # Prefer the item-item neighbor index: one history query, then scoring happens in memory
+        item_index = item_index_registry.get()
+        if item_index:
+            return await self._get_item_based_recommendations(user_id, item_index, db)
+
+        # Fall back to the user neighbor index, kept in memory by the registry
+        user_index = user_index_registry.get()
+        if user_index:
             # Find similar users and their purchases
-            if user_id in user_similarity:
-                similar_users = user_similarity[user_id][:5]  # Top 5 similar users
+            if user_id in user_index:
+                similar_users = user_index.neighbors_of(user_id, 5)  # Top 5 similar users
 
                 recommendations = {}
                 for similar_user, score in similar_users:
                     # Get products purchased by similar user but not by current user
-                    query = text("""
-                        SELECT DISTINCT p.id, p.name, :score as similarity_score
-                        FROM orders o
-                        JOIN order_items oi ON o.id = oi.order_id
-                        JOIN products p ON oi.product_id = p.id
-                        WHERE o.user_id = :similar_user
-                        AND p.id NOT IN (
-                            SELECT p2.id
-                            FROM orders o2
-                            JOIN order_items oi2 ON o2.id = oi2.order_id
-                            JOIN products p2 ON oi2.product_id = p2.id
-                            WHERE o2.user_id = :user_id
-                        )
-                        LIMIT 20
-                    """)
-
-                    result = await db.execute(query, {
+                    result = await db.execute(SIMILAR_USER_PURCHASES_QUERY, {
                         "similar_user": similar_user,
                         "user_id": user_id,
                         "score": score
@@ -174,7 +424,7 @@ class RecommendationService:
                     for row in result:
                         product_id = row[0]
                         recommendations[product_id] = {
-                            'score': score * 0.4,  # 40% weight
+                            'score': score,
                             'reason': f"Users similar to you purchased this"
                         }
 
@@ -182,6 +432,36 @@ class RecommendationService:
 
         return {}
 
+    async def _get_item_based_recommendations(
+        self,
+        user_id: str,
+        item_index: NeighborIndex,
+        db: AsyncSession
+    ) -> Dict[str, Dict]:
+        """Score neighbors of the user's recently purchased items using the precomputed item index"""
+        result = await db.execute(PURCHASE_HISTORY_QUERY, {"user_id": user_id})
+        purchased = [row[0] for row in result]
+        return self._score_item_neighbors(item_index, purchased)
+
+    def _score_item_neighbors(self, item_index: NeighborIndex, purchased: List[str]) -> Dict[str, Dict]:
+        """Collaborative candidates from a purchase history, most recent first"""
+        recommendations = {}
+        # Seed from the most recent purchases, but exclude everything the user already bought
+        for product_id, score in item_index.recommend(purchased[:20], exclude=set(purchased), limit=50):
+            recommendations[product_id] = {
+                'score': score,
+                'reason': "Customers who bought items you purchased also bought this"
+            }
+
+        return recommendations
+
+    def _score_similar_products(self, similar: List[Tuple[str, float]]) -> Dict[str, Dict]:
+        """Content candidates from content index matches"""
+        return {
+            product_id: {'score': score, 'reason': "Similar to products you purchased"}
+            for product_id, score in similar
+        }
+
     async def _get_content_recommendations(self, user_profile: Dict, db: AsyncSession) -> Dict[str, Dict]:
         """Get content-based recommendations based on user's preferred categories"""
         recommendations = {}
@@ -191,18 +471,7 @@ class RecommendationService:
             purchased_products = user_profile['purchased_products']
 
             # Find products in same categories, excluding already purchased
-            query = text("""
-                SELECT p.id, p.name, p.category,
-                       CASE WHEN p.category = ANY(:categories) THEN 0.8 ELSE 0.3 END as category_score
-                FROM products p
-                WHERE p.category = ANY(:categories)
-                AND p.id != ALL(:purchased_products)
-                AND p.is_active = true
-                ORDER BY category_score DESC, p.average_rating DESC
-                LIMIT 30
-            """)
-
-            result = await db.execute(query, {
+            result = await db.execute(CATEGORY_PRODUCTS_QUERY, {
                 "categories": categories,
                 "purchased_products": purchased_products or []
             })
@@ -211,7 +480,7 @@ class RecommendationService:
                 product_id = row[0]
                 category_score = row[3]
                 recommendations[product_id] = {
-                    'score': category_score * 0.3,  # 30% weight
+                    'score': category_score,
                     'reason': f"Based on your interest in {row[2]}"
                 }
 
@@ -224,132 +493,400 @@ class RecommendationService:
         limit: int,
         db: AsyncSession
     ) -> Dict[str, Dict]:
-        """Get location-based recommendations"""
+        """Get location-based recommendations from the in-memory shop index"""
         recommendations = {}
 
         if latitude and longitude:
             # Find products from shops within 5km
-            query = text("""
-                SELECT p.id, p.name,
-                       ST_Distance(s.location, ST_SetSRID(ST_MakePoint(:lng, :lat), 4326)) as distance
-                FROM products p
-                JOIN shops s ON p.shop_id = s.id
-                WHERE ST_DWithin(s.location, ST_SetSRID(ST_MakePoint(:lng, :lat), 4326), 5000)
-                AND p.is_active = true
-                AND s.is_open = true
-                ORDER BY distance ASC, p.average_rating DESC
-                LIMIT :limit
-            """)
-
-            result = await db.execute(query, {
-                "lat": latitude,
-                "lng": longitude,
-                "limit": limit
-            })
-
-            for row in result:
-                product_id = row[0]
-                distance = row[2]
+            for product_id, distance in self.shop_index.nearby_products(latitude, longitude, 5000, limit):
                 # Convert distance to score (closer = higher score)
                 distance_score = max(0, 1 - (distance / 5000))  # 0-1 score based on 5km range
 
                 recommendations[product_id] = {
-                    'score': distance_score * 0.2,  # 20% weight
+                    'score': distance_score,
                     'reason': f"Available at a nearby shop ({int(distance)}m away)"
                 }
 
         return recommendations
 
-    async def _get_trending_recommendations(self, limit: int, db: AsyncSession) -> Dict[str, Dict]:
-        """Get trending products based on recent activity"""
-        recommendations = {}
-
-        # Get products with high activity in last 7 days
-        query = text("""
-            SELECT p.id, p.name,
-                   COUNT(ue.id) as event_count,
-                   COUNT(DISTINCT CASE WHEN ue.event_type = 'purchase' THEN ue.user_id END) as purchase_count
-            FROM products p
-            LEFT JOIN user_events ue ON ue.event_data::json->>'product_id' = p.id
-            WHERE ue.created_at >= NOW() - INTERVAL '7 days'
-            AND p.is_active = true
-            GROUP BY p.id, p.name
-            ORDER BY (COUNT(ue.id) + COUNT(DISTINCT CASE WHEN ue.event_type = 'purchase' THEN ue.user_id END) * 5) DESC
-            LIMIT :limit
-        """)
-
-        result = await db.execute(query, {"limit": limit})
+    def _trending_scope(self, latitude: Optional[float], longitude: Optional[float]) -> str:
+        """The user's trending cell, or the global ranking when the location is unknown"""
+        if latitude and longitude:
+            return self.trending.cell_scope(latitude, longitude)
+        return GLOBAL_SCOPE
 
-        for row in result:
-            product_id = row[0]
-            event_count = row[2]
-            purchase_count = row[3]
+    async def _get_trending_recommendations(self, scope: str, limit: int, db: AsyncSession) -> Dict[str, Dict]:
+        """Get trending products of a scope from the rolling trending counters"""
+        recommendations = {}
+        reason = "Trending product right now" if scope == GLOBAL_SCOPE else "Trending product in your area"
 
-            # Calculate trending score
-            trending_score = min(1.0, (event_count + purchase_count * 5) / 100)  # Normalize
+        for product_id, score, _, _ in await self.trending.top(limit, scope):
+            # Decay-weighted views + 5 x purchases, normalized
+            trending_score = min(1.0, score / 100)
 
             recommendations[product_id] = {
-                'score': trending_score * 0.1,  # 10% weight
-                'reason': "Trending product in your area"
+                'score': trending_score,
+                'reason': reason
             }
 
         return recommendations
 
-    def _combine_recommendations(self, *recommendation_dicts) -> Dict[str, Dict]:
-        """Combine multiple recommendation sources"""
-        combined = {}
+    def _combine_recommendations(
+        self,
+        candidates_by_source: Dict[str, Dict[str, Dict]],
+        limit: int
+    ) -> List[Tuple[str, float, str, List[str]]]:
+        """Combine multiple recommendation sources into the top `limit` (product_id, score, reason, sources)"""
+        return blend_candidates(candidates_by_source, self.source_weights, limit)
+
+    async def _get_products_info(self, product_ids: List[str], db: AsyncSession) -> Dict[str, Dict]:
+        """Get product information for several products, served from the product cache where possible"""
+        if not product_ids:
+            return {}
+
+        products_info = {}
+        cached = await self.redis_client.mget([f"product:{product_id}" for product_id in product_ids])
+        for product_id, value in zip(product_ids, cached):
+            self._record_cache('product', 'hit' if value else 'miss')
+            if value:
+                products_info[product_id] = json.loads(value)
+
+        missing = [product_id for product_id in product_ids if product_id not in products_info]
+        if missing:
+            result = await db.execute(PRODUCTS_INFO_QUERY, {"ids": missing})
+
+            async with self.redis_client.pipeline(transaction=False) as pipe:
+                for row in result:
+                    product_info = {
+                        'name': row[1],
+                        'shop_name': row[2],
+                        'price': float(row[3]),
+                        'discount_price': float(row[4]) if row[4] else None,
+                        'image_url': row[5]
+                    }
+                    products_info[row[0]] = product_info
+                    pipe.setex(f"product:{row[0]}", settings.product_cache_ttl_seconds, json.dumps(product_info))
+                await pipe.execute()
+
+        return products_info
+
+    async def invalidate_products(self, product_ids: List[str]):
+        """Drop cached product information, e.g. after a price, name or availability change"""
+        if product_ids:
+            await self.redis_client.delete(*[f"product:{product_id}" for product_id in product_ids])
+        # Availability may have changed too, so rebuild the shop index soon
+        self.shop_index.request_refresh()
+
+    async def track_event(self, event: UserEventCreate):
+        """Track user event for learning"""
+        await self.track_events([event])
 
-        for rec_dict in recommendation_dicts:
-            for product_id, data in rec_dict.items():
-                if product_id not in combined:
-                    combined[product_id] = {'score': 0, 'reason': data['reason']}
-                combined[product_id]['score'] += data['score']
+    async def track_events(self, events: List[UserEventCreate]):
+        """Track a batch of user events; they are written to the database by the event buffer"""
+        await self.event_buffer.add(events)
+        await self.trending.record(events)
 
-        return combined
+        # Invalidate cache: one INCR per user in the batch, all in a single round trip.
+        # Entries under the old generation are never read again and expire via their TTL.
+        async with self.redis_client.pipeline(transaction=False) as pipe:
+            for user_id in {event.user_id for event in events}:
+                pipe.incr(f"recommendation_generation:{user_id}")
+            await pipe.execute()
 
-    async def _get_product_info(self, product_id: str, db: AsyncSession) -> Optional[Dict]:
-        """Get product information"""
-        query = text("""
-            SELECT p.name, s.name as shop_name, p.price, p.discount_price, p.image_url
-            FROM products p
-            JOIN shops s ON p.shop_id = s.id
-            WHERE p.id = :product_id
-        """)
+    async def get_recommendations_batch(
+        self,
+        user_ids: List[str],
+        limit: int = 10,
+        db: AsyncSession = None,
+        cache_ttl: int = settings.recommendation_cache_hard_ttl_seconds
+    ) -> Dict[str, List[RecommendationResponse]]:
+        """
+        Compute recommendations for many users in one pass and cache them.
+
+        Profiles, purchase histories and category candidates are each fetched with one query
+        for the whole batch, and trending once per trending cell; scoring and blending run in memory per user, and every
+        selected product is hydrated in a single lookup. Users are located at their stored
+        coordinates, and results are cached under the key get_recommendations reads for that
+        location cell. Entries are fresh for the usual soft TTL and kept, for stale serving,
+        until cache_ttl.
+        """
+        user_ids = list(dict.fromkeys(user_ids))
+        if not user_ids:
+            return {}
+
+        profiles = await self._get_user_profiles(user_ids, db)
+        histories = await self._get_purchase_histories(user_ids, db)
+
+        # Content similarity for the whole batch, USER_BLOCK users per matrix product;
+        # users without matches fall back to their preferred categories.
+        # The scoring runs in a thread so requests sharing this event loop keep being served.
+        content_index = content_index_registry.get()
+        similar_by_user = {}
+        if content_index:
+            similar = await asyncio.to_thread(
+                content_index.recommend_many,
+                [histories.get(user_id, [])[:20] for user_id in user_ids],
+                [set(histories.get(user_id, [])) for user_id in user_ids],
+                30
+            )
+            similar_by_user = {user_id: matches for user_id, matches in zip(user_ids, similar) if matches}
 
-        result = await db.execute(query, {"product_id": product_id})
-        row = result.fetchone()
+        categories = sorted({
+            category
+            for user_id, profile in profiles.items() if user_id not in similar_by_user
+            for category in profile['preferred_categories'] if category
+        })
+        category_products = await self._get_category_products(categories, db)
+        empty_profile = {'latitude': None, 'longitude': None, 'preferred_categories': [], 'purchased_products': []}
+        # Trending is read once per scope, shared by the users in the same cell
+        trending_by_scope = {}
+        location_by_user = {}
+        for user_id in user_ids:
+            profile = profiles.get(user_id) or empty_profile
+            scope = self._trending_scope(profile['latitude'], profile['longitude'])
+            if scope not in trending_by_scope:
+                trending_by_scope[scope] = await self._get_trending_recommendations(scope, limit * 2, db)
+            location_by_user[user_id] = (
+                scope,
+                await self._get_location_recommendations(profile['latitude'], profile['longitude'], limit * 2, db)
+            )
 
-        if row:
-            return {
-                'name': row[0],
-                'shop_name': row[1],
-                'price': float(row[2]),
-                'discount_price': float(row[3]) if row[3] else None,
-                'image_url': row[4]
+        def score_and_blend():
+            item_index = item_index_registry.get()
+            top_by_user = {}
+            for user_id in user_ids:
+                profile = profiles.get(user_id) or empty_profile
+                scope, location = location_by_user[user_id]
+                candidates_by_source = {
+                    'collaborative': self._score_item_neighbors(item_index, histories.get(user_id, [])) if item_index else {},
+                    'content': (
+                        self._score_similar_products(similar_by_user[user_id]) if user_id in similar_by_user
+                        else self._score_category_products(profile, category_products)
+                    ),
+                    'location': location,
+                    'trending': trending_by_scope[scope],
+                }
+                top_by_user[user_id] = self._combine_recommendations(candidates_by_source, limit)
+            return top_by_user
+
+        # Per-user scoring and blending is CPU work as well, so it runs off the event loop too
+        top_by_user = await asyncio.to_thread(score_and_blend)
+
+        product_ids = list({product_id for top in top_by_user.values() for product_id, _, _, _ in top})
+        products_info = await self._get_products_info(product_ids, db)
+
+        results = {}
+        for user_id, top in top_by_user.items():
+            results[user_id] = [
+                RecommendationResponse(
+                    product_id=product_id,
+                    product_name=products_info[product_id]['name'],
+                    shop_name=products_info[product_id]['shop_name'],
+                    price=products_info[product_id]['price'],
+                    discount_price=products_info[product_id].get('discount_price'),
+                    image_url=products_info[product_id].get('image_url'),
+                    score=round(score, 3),
+                    reason=reason,
+                    sources=sources
+                )
+                for product_id, score, reason, sources in top
+                if product_id in products_info
+            ]
+
+        # Store under each user's current generation, all in one round trip
+        soft_ttl = min(settings.recommendation_cache_ttl_seconds, cache_ttl)
+        generations = await self.redis_client.mget([f"recommendation_generation:{user_id}" for user_id in user_ids])
+        async with self.redis_client.pipeline(transaction=False) as pipe:
+            for user_id, generation in zip(user_ids, generations):
+                profile = profiles.get(user_id) or {}
+                cell = self._location_cell(profile.get('latitude'), profile.get('longitude')) or 'none'
+                cache_key = self._recommendations_cache_key(user_id, int(generation) if generation else 0, cell, limit)
+                pipe.setex(cache_key, cache_ttl, self._cache_entry([r.dict() for r in results[user_id]], soft_ttl))
+            await pipe.execute()
+
+        return results
+
+    async def _get_user_profiles(self, user_ids: List[str], db: AsyncSession) -> Dict[str, Dict[str, Any]]:
+        """User profiles for a batch of users, keyed by user id"""
+        result = await db.execute(USER_PROFILES_QUERY, {"user_ids": user_ids})
+        return {
+            row[0]: {
+                'latitude': row[1],
+                'longitude': row[2],
+                'preferred_categories': row[3] or [],
+                'purchased_products': [product_id for product_id in row[4] or [] if product_id]
             }
+            for row in result
+        }
 
-        return None
+    async def _get_purchase_histories(self, user_ids: List[str], db: AsyncSession) -> Dict[str, List[str]]:
+        """Up to 200 distinct purchased products per user, most recent first"""
+        result = await db.execute(PURCHASE_HISTORIES_QUERY, {"user_ids": user_ids})
+        histories = defaultdict(list)
+        for row in result:
+            histories[row[0]].append(row[1])
+        return histories
 
-    async def track_event(self, event: UserEventCreate, db: AsyncSession):
-        """Track user event for learning"""
-        from app.models.user_events import UserEvent
-        import uuid
-
-        user_event = UserEvent(
-            id=str(uuid.uuid4()),
-            user_id=event.user_id,
-            event_type=event.event_type,
-            event_data=json.dumps(event.event_data)
-        )
+    async def _get_category_products(self, categories: List[str], db: AsyncSession) -> Dict[str, List[tuple]]:
+        """Best rated active products per category, as (product_id, rating) lists"""
+        if not categories:
+            return {}
 
-        db.add(user_event)
-        await db.commit()
+        result = await db.execute(TOP_CATEGORY_PRODUCTS_QUERY, {"categories": categories})
+        category_products = defaultdict(list)
+        for row in result:
+            category_products[row[0]].append((row[1], float(row[2])))
+        return category_products
+
+    def _score_category_products(self, user_profile: Dict, category_products: Dict[str, List[tuple]]) -> Dict[str, Dict]:
+        """Content candidates for one user from the batch's per-category products"""
+        purchased = set(user_profile['purchased_products'])
+        candidates = [
+            (rating, product_id, category)
+            for category in user_profile['preferred_categories'] if category
+            for product_id, rating in category_products.get(category, [])
+            if product_id not in purchased
+        ]
+        candidates.sort(key=lambda candidate: candidate[0], reverse=True)
+
+        return {
+            product_id: {'score': 0.8, 'reason': f"Based on your interest in {category}"}
+            for _, product_id, category in candidates[:30]
+        }
 
-        # Invalidate cache
-        cache_key_pattern = f"recommendations:{event.user_id}:*"
-        # Note: In production, use SCAN for better performance
-        for key in self.redis_client.keys(cache_key_pattern):
-            self.redis_client.delete(key)
+    def _recommendations_cache_key(self, user_id: str, generation: int, cell: str, limit: int) -> str:
+        return f"recommendations:{user_id}:{generation}:{cell}:{limit}"
+
+    def _location_cell(self, latitude: Optional[float], longitude: Optional[float]) -> Optional[str]:
+        """Geohash cell used to share location-dependent results between nearby requests"""
+        if not (latitude and longitude):
+            return None
+        return encode_geohash(latitude, longitude, settings.geohash_precision)
+
+    def _record_cache(self, layer: str, result: str):
+        """Count a cache lookup as 'hit', 'stale' or 'miss'"""
+        self.cache_stats[layer]['hits' if result == 'hit' else 'misses' if result == 'miss' else result] += 1
+        CACHE_REQUESTS.labels(layer, result).inc()
+
+    def _cache_entry(self, value: Any, soft_ttl: int) -> str:
+        """JSON cache entry: the value and the time it stops being fresh"""
+        return json.dumps({'value': value, 'fresh_until': time.time() + soft_ttl})
+
+    async def _store_cached(self, key: str, value: Any, soft_ttl: int, hard_ttl: int):
+        await self.redis_client.setex(key, hard_ttl, self._cache_entry(value, soft_ttl))
+
+    async def _read_cache_entry(self, key: str) -> Optional[Dict[str, Any]]:
+        cached = await self.redis_client.get(key)
+        if not cached:
+            return None
+        entry = json.loads(cached)
+        # Values cached before entries carried a freshness time are treated as misses
+        return entry if isinstance(entry, dict) and 'fresh_until' in entry else None
+
+    async def _load_cached(self, key: str) -> Optional[Any]:
+        entry = await self._read_cache_entry(key)
+        return entry['value'] if entry else None
+
+    async def _get_cached(
+        self,
+        layer: str,
+        key: str,
+        soft_ttl: int,
+        hard_ttl: int,
+        compute: Callable[[AsyncSession], Awaitable[Any]]
+    ) -> Any:
+        """Return the JSON value cached under key, see _serve_cached"""
+        return await self._serve_cached(layer, key, await self._read_cache_entry(key), soft_ttl, hard_ttl, compute)
+
+    async def _serve_cached(
+        self,
+        layer: str,
+        key: str,
+        entry: Optional[Dict[str, Any]],
+        soft_ttl: int,
+        hard_ttl: int,
+        compute: Callable[[AsyncSession], Awaitable[Any]]
+    ) -> Any:
+        """
+        Stale-while-revalidate: a fresh entry is returned as is; an entry past its soft TTL is
+        returned too, with a background refresh scheduled; only a missing entry (past the hard
+        TTL) makes the caller wait for compute(session), shared with concurrent misses for the key.
+
+        compute always gets a session of its own: the computation outlives any one caller,
+        and a request-scoped session is closed as soon as its request is cancelled.
+        """
+        if entry is not None:
+            stale_for = time.time() - entry['fresh_until']
+            if stale_for <= 0:
+                self._record_cache(layer, 'hit')
+            else:
+                self._record_cache(layer, 'stale')
+                CACHE_STALE_AGE_SECONDS.labels(layer).observe(stale_for)
+                self._schedule_refresh(layer, key, soft_ttl, hard_ttl, compute, entry['fresh_until'])
+            return entry['value']
+
+        self._record_cache(layer, 'miss')
+
+        async def compute_and_store():
+            async with async_session() as session:
+                return await self._compute_and_store(key, compute, session, soft_ttl, hard_ttl)
+
+        return await self.single_flight.do(layer, key, compute_and_store, lambda: self._load_cached(key))
+
+    async def _compute_and_store(
+        self,
+        key: str,
+        compute: Callable[[AsyncSession], Awaitable[Any]],
+        db: AsyncSession,
+        soft_ttl: int,
+        hard_ttl: int
+    ) -> Any:
+        value = await compute(db)
+        if isinstance(value, CachedValue):
+            value, soft_ttl, hard_ttl = value
+        with stage_timer('cache_store'):
+            await self._store_cached(key, value, soft_ttl, hard_ttl)
+        return value
+
+    def _schedule_refresh(
+        self,
+        layer: str,
+        key: str,
+        soft_ttl: int,
+        hard_ttl: int,
+        compute: Callable[[AsyncSession], Awaitable[Any]],
+        stale_since: float
+    ):
+        """Recompute a stale entry in the background, on its own session since the request's closes first"""
+        async def compute_and_store():
+            async with async_session() as session:
+                await self._compute_and_store(key, compute, session, soft_ttl, hard_ttl)
+            CACHE_REFRESH_LAG_SECONDS.labels(layer).observe(time.time() - stale_since)
+
+        async def refresh():
+            try:
+                await self.single_flight.refresh(key, compute_and_store)
+            except Exception as e:
+                print(f"Error refreshing cache entry {key}: {e}")
+
+        task = asyncio.create_task(refresh())
+        self._refresh_tasks.add(task)
+        task.add_done_callback(self._refresh_tasks.discard)
+
+    def get_cache_stats(self) -> Dict[str, Dict[str, Any]]:
+        """Hit/miss counts and hit ratio per cache layer"""
+        stats = {}
+        for layer, counts in self.cache_stats.items():
+            total = counts['hits'] + counts['stale'] + counts['misses']
+            # Stale serves are answered from the cache, so they count towards the hit ratio
+            served = counts['hits'] + counts['stale']
+            stats[layer] = {**counts, 'hit_ratio': round(served / total, 4) if total else None}
+        return stats
+
+    async def _get_cache_generation(self, user_id: str) -> int:
+        """Current cache generation for a user's recommendations"""
+        generation = await self.redis_client.get(f"recommendation_generation:{user_id}")
+        return int(generation) if generation else 0
 
     async def get_trending_products(
         self,
@@ -358,37 +895,36 @@ class RecommendationService:
         limit: int,
         db: AsyncSession
     ) -> List[TrendingProduct]:
-        """Get trending products in area"""
-        query = text("""
-            SELECT p.id, p.name, s.name as shop_name,
-                   COUNT(ue.id) as view_count,
-                   COUNT(DISTINCT CASE WHEN ue.event_type = 'purchase' THEN ue.user_id END) as order_count
-            FROM products p
-            JOIN shops s ON p.shop_id = s.id
-            LEFT JOIN user_events ue ON ue.event_data::json->>'product_id' = p.id
-            WHERE ST_DWithin(s.location, ST_SetSRID(ST_MakePoint(:lng, :lat), 4326), 5000)
-            AND ue.created_at >= NOW() - INTERVAL '7 days'
-            AND p.is_active = true
-            GROUP BY p.id, p.name, s.name
-            ORDER BY (COUNT(ue.id) + COUNT(DISTINCT CASE WHEN ue.event_type = 'purchase' THEN ue.user_id END) * 3) DESC
-            LIMIT :limit
-        """)
-
-        result = await db.execute(query, {
-            "lat": latitude,
-            "lng": longitude,
-            "limit": limit
-        })
+        """Get trending products in the area's trending cell, cached per cell"""
+        if not (latitude and longitude):
+            return []
+
+        scope = self.trending.cell_scope(latitude, longitude)
+        trending = await self._get_cached(
+            'trending_products',
+            f"trending_products:{scope}:{limit}",
+            settings.geo_cache_ttl_seconds,
+            settings.geo_cache_hard_ttl_seconds,
+            lambda session: self._query_trending_products(scope, limit, session)
+        )
+        return [TrendingProduct(**product) for product in trending]
+
+    async def _query_trending_products(self, scope: str, limit: int, db: AsyncSession) -> List[Dict[str, Any]]:
+        """Top trending products of a scope with their product details"""
+        ranked = await self.trending.top(limit, scope)
+        products_info = await self._get_products_info([product_id for product_id, _, _, _ in ranked], db)
 
         trending = []
-        for row in result:
-            trending.append(TrendingProduct(
-                product_id=row[0],
-                product_name=row[1],
-                shop_name=row[2],
-                view_count=row[3],
-                order_count=row[4]
-            ))
+        for product_id, _, view_count, order_count in ranked:
+            product_info = products_info.get(product_id)
+            if product_info:
+                trending.append(TrendingProduct(
+                    product_id=product_id,
+                    product_name=product_info['name'],
+                    shop_name=product_info['shop_name'],
+                    view_count=view_count,
+                    order_count=order_count
+                ).dict())
 
         return trending
 
@@ -399,23 +935,37 @@ class RecommendationService:
         limit: int,
         db: AsyncSession
     ) -> List[PopularShop]:
-        """Get popular shops in area"""
-        query = text("""
-            SELECT s.id, s.name,
-                   COUNT(o.id) as order_count,
-                   COALESCE(s.average_rating, 0) as average_rating
-            FROM shops s
-            LEFT JOIN orders o ON s.id = o.shop_id AND o.created_at >= NOW() - INTERVAL '30 days'
-            WHERE ST_DWithin(s.location, ST_SetSRID(ST_MakePoint(:lng, :lat), 4326), 5000)
-            AND s.is_open = true
-            GROUP BY s.id, s.name, s.average_rating
-            ORDER BY order_count DESC, average_rating DESC
-            LIMIT :limit
-        """)
-
-        result = await db.execute(query, {
-            "lat": latitude,
-            "lng": longitude,
+        """Get popular shops in area, cached per location cell"""
+        cell = self._location_cell(latitude, longitude)
+        if not cell:
+            return []
+        center_latitude, center_longitude = geohash_center(cell)
+        popular = await self._get_cached(
+            'popular_shops',
+            f"popular_shops:{cell}:{limit}",
+            settings.geo_cache_ttl_seconds,
+            settings.geo_cache_hard_ttl_seconds,
+            lambda session: self._query_popular_shops(center_latitude, center_longitude, limit, session)
+        )
+        return [PopularShop(**shop) for shop in popular]
+
+    async def _query_popular_shops(
+        self,
+        latitude: float,
+        longitude: float,
+        limit: int,
+        db: AsyncSession
+    ) -> List[Dict[str, Any]]:
+        """Query popular shops around a point"""
+        shop_ids = self.shop_index.shop_ids_within(latitude, longitude, 5000)
+        if not shop_ids:
+            return []
+
+        # Summing at most a window of day buckets per shop replaces scanning the orders themselves
+        since_day = datetime.now(timezone.utc).date() - timedelta(days=settings.popular_shops_window_days - 1)
+        result = await db.execute(POPULAR_SHOPS_QUERY, {
+            "shop_ids": shop_ids,
+            "since_day": since_day,
             "limit": limit
         })
 
@@ -426,6 +976,6 @@ class RecommendationService:
                 shop_name=row[1],
                 order_count=row[2],
                 average_rating=float(row[3])
-            ))
+            ).dict())
 
         return popular
\ No newline at end of file
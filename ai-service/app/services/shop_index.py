@@ -0,0 +1,199 @@
+import asyncio
+import time
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+from sqlalchemy import text
+
+from app.services.geo import EARTH_RADIUS_M, haversine_m
+
+
+class ShopSnapshot:
+    """
+    Open shops sorted by latitude, with their active products grouped per shop.
+    Products of shop i are product_ids[product_offsets[i]:product_offsets[i + 1]].
+    """
+
+    def __init__(
+        self,
+        shop_ids: np.ndarray,
+        latitudes: np.ndarray,
+        longitudes: np.ndarray,
+        product_ids: np.ndarray,
+        product_shops: np.ndarray,
+        product_ratings: np.ndarray,
+        product_offsets: np.ndarray
+    ):
+        self.shop_ids = shop_ids
+        self.latitudes = latitudes
+        self.longitudes = longitudes
+        self.product_ids = product_ids
+        self.product_shops = product_shops
+        self.product_rows: Dict[str, int] = {product_id: i for i, product_id in enumerate(product_ids.tolist())}
+        self.product_ratings = product_ratings
+        self.product_offsets = product_offsets
+        self.built_at = time.time()
+
+
+class ShopSpatialIndex:
+    """
+    In-memory spatial index of open shops and their active products.
+    Rebuilt from the database every refresh_interval seconds, or sooner when request_refresh() is called.
+    """
+
+    def __init__(self, session_factory, refresh_interval: float):
+        self.session_factory = session_factory
+        self.refresh_interval = refresh_interval
+        self._snapshot: Optional[ShopSnapshot] = None
+        self._refresh_requested = asyncio.Event()
+        self._refresh_task: Optional[asyncio.Task] = None
+
+    @property
+    def ready(self) -> bool:
+        return self._snapshot is not None
+
+    async def refresh(self):
+        """Load open shops and active products and swap in a new snapshot"""
+        shop_query = text("""
+            SELECT s.id, s.latitude, s.longitude
+            FROM shops s
+            WHERE s.is_open = true
+            AND s.latitude IS NOT NULL AND s.longitude IS NOT NULL
+        """)
+        product_query = text("""
+            SELECT p.shop_id, p.id, COALESCE(p.average_rating, 0)
+            FROM products p
+            JOIN shops s ON p.shop_id = s.id
+            WHERE p.is_active = true
+            AND s.is_open = true
+        """)
+
+        async with self.session_factory() as db:
+            shops = (await db.execute(shop_query)).fetchall()
+            products = (await db.execute(product_query)).fetchall()
+
+        self._snapshot = await asyncio.to_thread(self._build, shops, products)
+        print(f"Shop index refreshed: {len(shops)} shops, {len(products)} products")
+
+    @staticmethod
+    def _build(shops, products) -> ShopSnapshot:
+        shop_ids = np.array([row[0] for row in shops], dtype=str)
+        latitudes = np.array([row[1] for row in shops], dtype=np.float64)
+        longitudes = np.array([row[2] for row in shops], dtype=np.float64)
+
+        # Sort by latitude so a radius query can binary-search its latitude band
+        order = np.argsort(latitudes, kind='stable')
+        shop_ids, latitudes, longitudes = shop_ids[order], latitudes[order], longitudes[order]
+        shop_positions = {shop_id: i for i, shop_id in enumerate(shop_ids.tolist())}
+
+        product_shops = np.array([shop_positions.get(row[0], -1) for row in products], dtype=np.int64)
+        product_ids = np.array([row[1] for row in products], dtype=str)
+        product_ratings = np.array([row[2] for row in products], dtype=np.float32)
+
+        # Group products by shop position, CSR style
+        known = product_shops >= 0
+        product_shops, product_ids, product_ratings = product_shops[known], product_ids[known], product_ratings[known]
+        order = np.argsort(product_shops, kind='stable')
+        product_shops, product_ids, product_ratings = product_shops[order], product_ids[order], product_ratings[order]
+        product_offsets = np.searchsorted(product_shops, np.arange(len(shop_ids) + 1))
+
+        return ShopSnapshot(shop_ids, latitudes, longitudes, product_ids, product_shops, product_ratings, product_offsets)
+
+    def shops_within(self, latitude: float, longitude: float, radius_m: float) -> Tuple[np.ndarray, np.ndarray]:
+        """Positions of shops within radius_m of a point and their distances in metres"""
+        snapshot = self._snapshot
+        if snapshot is None or len(snapshot.shop_ids) == 0:
+            return np.empty(0, dtype=np.int64), np.empty(0)
+
+        # Latitude band first (binary search), then a longitude box, then exact haversine distance
+        lat_delta = np.degrees(radius_m / EARTH_RADIUS_M)
+        start, end = np.searchsorted(snapshot.latitudes, [latitude - lat_delta, latitude + lat_delta + 1e-12])
+        candidates = np.arange(start, end)
+
+        lng_delta = lat_delta / max(np.cos(np.radians(latitude)), 1e-6)
+        lng_diff = np.abs((snapshot.longitudes[candidates] - longitude + 180) % 360 - 180)
+        candidates = candidates[lng_diff <= lng_delta]
+
+        distances = haversine_m(latitude, longitude, snapshot.latitudes[candidates], snapshot.longitudes[candidates])
+        within = distances <= radius_m
+        return candidates[within], distances[within]
+
+    def shop_ids_within(self, latitude: float, longitude: float, radius_m: float) -> List[str]:
+        """Ids of open shops within radius_m of a point"""
+        positions, _ = self.shops_within(latitude, longitude, radius_m)
+        return self._snapshot.shop_ids[positions].tolist() if len(positions) else []
+
+    def nearby_products(
+        self,
+        latitude: float,
+        longitude: float,
+        radius_m: float,
+        limit: int
+    ) -> List[Tuple[str, float]]:
+        """Active products at open shops within radius_m, nearest first, then by rating"""
+        snapshot = self._snapshot
+        positions, distances = self.shops_within(latitude, longitude, radius_m)
+        if len(positions) == 0:
+            return []
+
+        starts = snapshot.product_offsets[positions]
+        counts = snapshot.product_offsets[positions + 1] - starts
+        if counts.sum() == 0:
+            return []
+
+        product_rows = np.concatenate([np.arange(s, s + c) for s, c in zip(starts, counts) if c])
+        product_distances = np.repeat(distances, counts)
+        order = np.lexsort((-snapshot.product_ratings[product_rows], product_distances))[:limit]
+
+        return [
+            (str(snapshot.product_ids[product_rows[i]]), float(product_distances[i]))
+            for i in order
+        ]
+
+    def product_location(self, product_id: str) -> Optional[Tuple[float, float]]:
+        """(latitude, longitude) of the shop selling an active product, if known"""
+        snapshot = self._snapshot
+        if snapshot is None:
+            return None
+
+        row = snapshot.product_rows.get(product_id)
+        if row is None:
+            return None
+        shop = snapshot.product_shops[row]
+        return float(snapshot.latitudes[shop]), float(snapshot.longitudes[shop])
+
+    def request_refresh(self):
+        """Rebuild the snapshot soon, e.g. after shops or products changed"""
+        self._refresh_requested.set()
+
+    async def _refresh_periodically(self):
+        while True:
+            try:
+                await asyncio.wait_for(self._refresh_requested.wait(), timeout=self.refresh_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._refresh_requested.clear()
+
+            try:
+                await self.refresh()
+            except Exception as e:
+                print(f"Error refreshing shop index: {e}")
+
+    async def start(self):
+        """Build the first snapshot and keep it fresh in the background"""
+        try:
+            await self.refresh()
+        except Exception as e:
+            print(f"Error building shop index: {e}")
+
+        if self._refresh_task is None:
+            self._refresh_task = asyncio.create_task(self._refresh_periodically())
+
+    async def stop(self):
+        if self._refresh_task is not None:
+            self._refresh_task.cancel()
+            try:
+                await self._refresh_task
+            except asyncio.CancelledError:
+                pass
+            self._refresh_task = None
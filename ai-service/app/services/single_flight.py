@@ -0,0 +1,118 @@
+import asyncio
+import time
+import uuid
+from typing import Any, Awaitable, Callable, Dict, Optional, Set
+
+from app.core.metrics import CACHE_COALESCED
+
+# Delete the lock only if this process still holds it; an expired lock may belong to another worker now
+RELEASE_LOCK_SCRIPT = """
+if redis.call('get', KEYS[1]) == ARGV[1] then
+    return redis.call('del', KEYS[1])
+end
+return 0
+"""
+
+
+class SingleFlight:
+    """
+    Coalesces concurrent cache misses for the same key into one computation.
+
+    Within a worker, callers that miss while a computation for the key is running await
+    that computation instead of starting their own. Across workers, the computing process
+    holds a short Redis lock (lock:<key>); the others poll the cache for up to wait_seconds
+    for the value it stores, and only compute themselves if none appears in time.
+
+    compute() is expected to store the value in the cache itself; load() reads it back
+    and returns None while it isn't there.
+
+    refresh() is the non-blocking variant for background revalidation: it runs compute()
+    only if no refresh of the key is running in this worker and no worker holds the lock.
+    """
+
+    def __init__(self, redis_client, lock_ttl: float, wait_seconds: float, poll_interval: float):
+        self.redis_client = redis_client
+        self.lock_ttl = lock_ttl
+        self.wait_seconds = wait_seconds
+        self.poll_interval = poll_interval
+        self._inflight: Dict[str, asyncio.Task] = {}
+        self._refreshing: Set[str] = set()
+        self._release_lock = redis_client.register_script(RELEASE_LOCK_SCRIPT)
+
+    async def do(
+        self,
+        layer: str,
+        key: str,
+        compute: Callable[[], Awaitable[Any]],
+        load: Callable[[], Awaitable[Optional[Any]]]
+    ) -> Any:
+        task = self._inflight.get(key)
+        if task is not None:
+            CACHE_COALESCED.labels(layer, 'worker').inc()
+        else:
+            task = asyncio.create_task(self._run(layer, key, compute, load))
+            self._inflight[key] = task
+            task.add_done_callback(lambda _: self._inflight.pop(key, None))
+        # A waiter being cancelled must not cancel the computation the others are waiting on
+        return await asyncio.shield(task)
+
+    async def refresh(self, key: str, compute: Callable[[], Awaitable[Any]]) -> bool:
+        """Run compute() unless a refresh of key is already running somewhere; True if it ran"""
+        if key in self._refreshing or key in self._inflight:
+            return False
+        self._refreshing.add(key)
+        try:
+            token = await self._acquire(key)
+            if token is None:
+                return False
+            try:
+                await compute()
+                return True
+            finally:
+                await self._release(key, token)
+        finally:
+            self._refreshing.discard(key)
+
+    async def _run(
+        self,
+        layer: str,
+        key: str,
+        compute: Callable[[], Awaitable[Any]],
+        load: Callable[[], Awaitable[Optional[Any]]]
+    ) -> Any:
+        token = await self._acquire(key)
+        if token is None:
+            value = await self._wait_for(load)
+            if value is not None:
+                CACHE_COALESCED.labels(layer, 'redis').inc()
+                return value
+            # The lock holder is slow or gone; compute rather than keep the caller waiting
+            CACHE_COALESCED.labels(layer, 'lock_timeout').inc()
+            return await compute()
+
+        try:
+            return await compute()
+        finally:
+            await self._release(key, token)
+
+    async def _acquire(self, key: str) -> Optional[str]:
+        """Take the cross-worker lock for key; returns its token, or None if another process holds it"""
+        token = uuid.uuid4().hex
+        if await self.redis_client.set(f"lock:{key}", token, nx=True, px=int(self.lock_ttl * 1000)):
+            return token
+        return None
+
+    async def _release(self, key: str, token: str):
+        try:
+            await self._release_lock(keys=[f"lock:{key}"], args=[token])
+        except Exception as e:
+            print(f"Error releasing cache lock lock:{key}: {e}")
+
+    async def _wait_for(self, load: Callable[[], Awaitable[Optional[Any]]]) -> Optional[Any]:
+        deadline = time.monotonic() + self.wait_seconds
+        while time.monotonic() < deadline:
+            await asyncio.sleep(self.poll_interval)
+            value = await load()
+            if value is not None:
+                return value
+        return None
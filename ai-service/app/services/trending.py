@@ -0,0 +1,127 @@
+import time
+from typing import List, Tuple
+
+from app.services.geo import encode_geohash
+from app.schemas.recommendation import UserEventCreate
+
+GLOBAL_SCOPE = "global"
+# Purchases are a much stronger signal than views
+PURCHASE_WEIGHT = 5
+BUCKET_SECONDS = 3600
+
+
+class TrendingCounters:
+    """
+    Rolling per-product activity counts kept in Redis, globally and per geohash cell.
+
+    record() adds events to hourly bucket sorted sets as they arrive. aggregate() periodically
+    folds the buckets of the last window_hours into one sorted set per scope, weighting each
+    bucket by 0.5 ** (age / half_life_hours), so top() is a single ZREVRANGE per request.
+    """
+
+    def __init__(
+        self,
+        redis_client,
+        shop_index=None,
+        geohash_precision: int = 5,
+        window_hours: int = 168,
+        half_life_hours: float = 24,
+        max_products: int = 500
+    ):
+        self.redis_client = redis_client
+        self.shop_index = shop_index
+        self.geohash_precision = geohash_precision
+        self.window_hours = window_hours
+        self.half_life_hours = half_life_hours
+        self.max_products = max_products
+
+    def cell_scope(self, latitude: float, longitude: float) -> str:
+        return f"cell:{encode_geohash(latitude, longitude, self.geohash_precision)}"
+
+    def _scopes_for(self, product_id: str) -> List[str]:
+        scopes = [GLOBAL_SCOPE]
+        location = self.shop_index.product_location(product_id) if self.shop_index else None
+        if location:
+            scopes.append(self.cell_scope(*location))
+        return scopes
+
+    async def record(self, events: List[UserEventCreate]):
+        """Count events that reference a product into the current hour's buckets"""
+        hour = int(time.time() // BUCKET_SECONDS)
+        # Buckets outlive the window by a day so aggregate() never reads a half-expired bucket
+        ttl = (self.window_hours + 24) * BUCKET_SECONDS
+
+        async with self.redis_client.pipeline(transaction=False) as pipe:
+            counted = False
+            for event in events:
+                product_id = event.event_data.get('product_id')
+                if not product_id:
+                    continue
+                product_id = str(product_id)
+
+                for scope in self._scopes_for(product_id):
+                    kinds = ['views', 'purchases'] if event.event_type == 'purchase' else ['views']
+                    for kind in kinds:
+                        key = f"trending:{scope}:{kind}:{hour}"
+                        pipe.zincrby(key, 1, product_id)
+                        pipe.expire(key, ttl)
+                    pipe.sadd("trending:scopes", scope)
+                counted = True
+
+            if counted:
+                await pipe.execute()
+
+    async def aggregate(self) -> int:
+        """Rebuild the decayed score and count sets of every scope; returns the number of scopes kept"""
+        hour = int(time.time() // BUCKET_SECONDS)
+        hours = range(hour - self.window_hours + 1, hour + 1)
+        decay = {h: 0.5 ** ((hour - h) / self.half_life_hours) for h in hours}
+
+        scopes = [scope.decode() if isinstance(scope, bytes) else scope
+                  for scope in await self.redis_client.smembers("trending:scopes")]
+        kept = 0
+        for scope in scopes:
+            views = {f"trending:{scope}:views:{h}": weight for h, weight in decay.items()}
+            purchases = {f"trending:{scope}:purchases:{h}": weight * PURCHASE_WEIGHT for h, weight in decay.items()}
+
+            # Build into temporary keys and rename, so readers never see a half-built set
+            async with self.redis_client.pipeline(transaction=False) as pipe:
+                pipe.zunionstore(f"trending:{scope}:score:tmp", {**views, **purchases})
+                pipe.zremrangebyrank(f"trending:{scope}:score:tmp", 0, -self.max_products - 1)
+                pipe.zunionstore(f"trending:{scope}:view_count:tmp", list(views))
+                pipe.zunionstore(f"trending:{scope}:order_count:tmp", list(purchases))
+                sizes = await pipe.execute()
+
+            if not sizes[0]:
+                # Nothing left in the window for this scope
+                await self.redis_client.delete(*(f"trending:{scope}:{name}" for name in ('score', 'view_count', 'order_count')))
+                await self.redis_client.srem("trending:scopes", scope)
+                continue
+
+            async with self.redis_client.pipeline(transaction=True) as pipe:
+                for name, size in (('score', sizes[0]), ('view_count', sizes[2]), ('order_count', sizes[3])):
+                    if size:
+                        pipe.rename(f"trending:{scope}:{name}:tmp", f"trending:{scope}:{name}")
+                    else:
+                        pipe.delete(f"trending:{scope}:{name}")
+                await pipe.execute()
+            kept += 1
+
+        return kept
+
+    async def top(self, limit: int, scope: str = GLOBAL_SCOPE) -> List[Tuple[str, float, int, int]]:
+        """Top products of a scope as (product_id, score, view_count, order_count), best first"""
+        ranked = await self.redis_client.zrevrange(f"trending:{scope}:score", 0, limit - 1, withscores=True)
+        if not ranked:
+            return []
+
+        product_ids = [product_id.decode() if isinstance(product_id, bytes) else product_id for product_id, _ in ranked]
+        async with self.redis_client.pipeline(transaction=False) as pipe:
+            pipe.zmscore(f"trending:{scope}:view_count", product_ids)
+            pipe.zmscore(f"trending:{scope}:order_count", product_ids)
+            view_counts, order_counts = await pipe.execute()
+
+        return [
+            (product_id, float(score), int(views or 0), int(orders or 0))
+            for product_id, (_, score), views, orders in zip(product_ids, ranked, view_counts, order_counts)
+        ]
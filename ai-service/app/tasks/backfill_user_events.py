@@ -0,0 +1,101 @@
+import argparse
+import asyncio
+import time
+
+from sqlalchemy import text
+
+from app.core.config import settings
+from app.core.database import create_tables, engine
+
+# Same names create_all gives the indexes on new installs
+CREATE_INDEXES = [
+    "CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_user_events_product_id ON user_events (product_id)",
+    "CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_user_events_shop_id ON user_events (shop_id)",
+]
+
+NEXT_BATCH_QUERY = text("""
+    SELECT id FROM user_events
+    WHERE id > :after
+    ORDER BY id
+    LIMIT :batch_size
+""")
+
+# Parse each row's JSON once; rows that already have typed fields are left alone
+BACKFILL_QUERY = text("""
+    UPDATE user_events ue
+    SET product_id = NULLIF(d.data->>'product_id', ''),
+        shop_id = NULLIF(d.data->>'shop_id', ''),
+        quantity = CASE WHEN d.data->>'quantity' ~ '^-?[0-9]+$' THEN (d.data->>'quantity')::integer END
+    FROM (
+        SELECT id, event_data::json as data
+        FROM user_events
+        WHERE id = ANY(:ids)
+        AND product_id IS NULL AND shop_id IS NULL AND quantity IS NULL
+    ) d
+    WHERE ue.id = d.id
+""")
+
+async def migrate_user_events():
+    """
+    Index the typed event columns of an existing user_events table.
+    The columns themselves are added by create_tables() when the service starts.
+    """
+    await create_tables()
+
+    # CREATE INDEX CONCURRENTLY doesn't block writers but can't run inside a transaction.
+    # The pool's statement timeout would cancel a long build and leave an INVALID index that
+    # IF NOT EXISTS then skips, so the session uses the batch timeout and restores it after.
+    async with engine.connect() as conn:
+        conn = await conn.execution_options(isolation_level="AUTOCOMMIT")
+        await conn.execute(text(f"SET statement_timeout = {int(settings.batch_statement_timeout_ms)}"))
+        try:
+            for statement in CREATE_INDEXES:
+                await conn.execute(text(statement))
+        finally:
+            await conn.execute(text("RESET statement_timeout"))
+
+    print("user_events indexes are in place")
+
+async def backfill_user_events(batch_size: int = 5000, pause_seconds: float = 0.1):
+    """
+    Copy product_id, shop_id and quantity out of event_data for existing rows.
+    Walks the table in id order, one short transaction per batch, so it can be stopped
+    and restarted at any time and never holds locks on more than one batch.
+    """
+    started = time.perf_counter()
+    after = ""
+    scanned = updated = 0
+
+    while True:
+        async with engine.begin() as conn:
+            ids = [row[0] for row in await conn.execute(NEXT_BATCH_QUERY, {"after": after, "batch_size": batch_size})]
+            if not ids:
+                break
+            result = await conn.execute(BACKFILL_QUERY, {"ids": ids})
+
+        after = ids[-1]
+        scanned += len(ids)
+        updated += result.rowcount
+        print(f"Backfilled {updated} of {scanned} user events scanned so far")
+
+        # Leave room for live traffic between batches
+        await asyncio.sleep(pause_seconds)
+
+    print(f"User event backfill completed in {time.perf_counter() - started:.1f}s ({updated} rows updated)")
+
+# Usage: python -m app.tasks.backfill_user_events
+# Safe to re-run; run it again with --skip-migrate once every worker writes the typed columns,
+# to pick up rows older workers inserted in the meantime.
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Index and backfill typed columns on user_events")
+    parser.add_argument("--batch-size", type=int, default=5000)
+    parser.add_argument("--pause", type=float, default=0.1, help="Seconds to sleep between batches")
+    parser.add_argument("--skip-migrate", action="store_true", help="Only backfill, indexes already exist")
+    args = parser.parse_args()
+
+    async def main():
+        if not args.skip_migrate:
+            await migrate_user_events()
+        await backfill_user_events(args.batch_size, args.pause)
+
+    asyncio.run(main())
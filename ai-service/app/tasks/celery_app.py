@@ -0,0 +1,90 @@
+import asyncio
+from datetime import timedelta
+
+from celery import Celery
+from celery.schedules import crontab
+
+from app.core.config import settings
+
+celery_app = Celery("ai_service", broker=settings.redis_url, backend=settings.redis_url)
+
+celery_app.conf.update(
+    task_routes={
+        "app.tasks.celery_app.retrain_model": {"queue": "retraining"},
+        "app.tasks.celery_app.refresh_trending": {"queue": "retraining"},
+        "app.tasks.celery_app.prewarm_recommendations": {"queue": "retraining"},
+        "app.tasks.celery_app.refresh_shop_rollups": {"queue": "retraining"},
+    },
+    # Long-running task: take one at a time and only acknowledge it once it finishes
+    task_acks_late=True,
+    worker_prefetch_multiplier=1,
+    # With late acks, a task still running past the visibility timeout is handed out again
+    broker_transport_options={"visibility_timeout": settings.celery_visibility_timeout_seconds},
+    beat_schedule={
+        # Full rebuilds keep the model consistent; incremental runs fold in new activity in between
+        "retrain-model": {
+            "task": "app.tasks.celery_app.retrain_model",
+            "schedule": timedelta(hours=settings.retraining_interval_hours),
+        },
+        "update-model-incremental": {
+            "task": "app.tasks.celery_app.retrain_model",
+            "schedule": timedelta(minutes=settings.incremental_retraining_interval_minutes),
+            "kwargs": {"mode": "incremental"},
+        },
+        "refresh-trending": {
+            "task": "app.tasks.celery_app.refresh_trending",
+            "schedule": timedelta(minutes=settings.trending_refresh_minutes),
+        },
+        "prewarm-recommendations": {
+            "task": "app.tasks.celery_app.prewarm_recommendations",
+            "schedule": crontab(hour=settings.prewarm_hour, minute=0),
+        },
+        "refresh-shop-rollups": {
+            "task": "app.tasks.celery_app.refresh_shop_rollups",
+            "schedule": timedelta(minutes=settings.shop_rollup_refresh_minutes),
+        },
+    },
+)
+
+def _run(coroutine):
+    """
+    Run a task coroutine on a fresh event loop. Pooled database connections are tied to the
+    loop that opened them, so the shared engine's pool is emptied before the loop closes.
+    """
+    from app.core.database import engine
+
+    async def run():
+        try:
+            await coroutine
+        finally:
+            await engine.dispose()
+
+    asyncio.run(run())
+
+@celery_app.task
+def retrain_model(workers=None, mode="full"):
+    """Retrain the recommendation model in the Celery worker, away from the web process"""
+    from app.tasks.retraining_task import retrain_model_task
+
+    _run(retrain_model_task(workers, mode))
+
+@celery_app.task
+def refresh_trending():
+    """Fold recent trending buckets into the decayed per-scope rankings"""
+    from app.tasks.retraining_task import update_trending_cache
+
+    asyncio.run(update_trending_cache())
+
+@celery_app.task
+def prewarm_recommendations(limit=10):
+    """Nightly pass caching recommendations for recently active users"""
+    from app.tasks.prewarm_task import prewarm_recommendations_task
+
+    _run(prewarm_recommendations_task(limit))
+
+@celery_app.task
+def refresh_shop_rollups():
+    """Recount the recent days of per-shop orders behind popular shops"""
+    from app.tasks.shop_rollups import refresh_shop_rollups as refresh
+
+    _run(refresh())
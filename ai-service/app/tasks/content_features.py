@@ -0,0 +1,51 @@
+import numpy as np
+import pandas as pd
+from scipy import sparse
+from sklearn.decomposition import TruncatedSVD
+from sklearn.feature_extraction.text import HashingVectorizer, TfidfTransformer
+from sklearn.preprocessing import normalize
+
+from app.services.content_index import ContentIndex
+
+# Relative weight of each attribute token next to the unit-norm text features
+ATTRIBUTE_WEIGHT = 0.5
+
+
+def _attribute_tokens(products: pd.DataFrame) -> pd.Series:
+    """Category, price band (powers of two) and shop as one token each"""
+    price_band = np.floor(np.log2(products['price'].fillna(0).astype(float).clip(lower=0) + 1)).astype(int)
+    return (
+        "category_" + products['category'].fillna('').astype(str).str.lower()
+        + " price_" + price_band.astype(str)
+        + " shop_" + products['shop_id'].astype(str)
+    )
+
+
+def build_content_index(products: pd.DataFrame, dims: int, seed: int = 0) -> ContentIndex:
+    """
+    Build product feature vectors from (id, name, description, category, price, shop_id) rows.
+
+    Name and description become hashed TF-IDF features; category, price band and shop are
+    hashed attribute tokens. The sparse features are reduced to `dims` dense components (LSA),
+    so related words and attributes end up close together, then L2-normalized as float32.
+    """
+    # Hash widths stay modest: the SVD's time and memory grow with the number of feature columns
+    text = products['name'].fillna('').astype(str) + " " + products['description'].fillna('').astype(str)
+    text_features = HashingVectorizer(n_features=2 ** 15, alternate_sign=False, norm=None).transform(text)
+    text_features = TfidfTransformer(sublinear_tf=True).fit_transform(text_features)
+
+    attribute_features = HashingVectorizer(
+        n_features=2 ** 12, alternate_sign=False, norm=None, token_pattern=r"\S+", lowercase=False
+    ).transform(_attribute_tokens(products)) * ATTRIBUTE_WEIGHT
+
+    features = sparse.hstack([text_features, attribute_features], format='csr')
+
+    # TruncatedSVD needs fewer components than either dimension
+    components = min(dims, features.shape[0] - 1, features.shape[1] - 1)
+    if components >= 2:
+        vectors = TruncatedSVD(n_components=components, random_state=seed).fit_transform(features)
+    else:
+        vectors = features.toarray()
+
+    vectors = normalize(vectors.astype(np.float32), norm='l2', axis=1)
+    return ContentIndex.from_arrays(products['id'].to_numpy(), vectors)
@@ -0,0 +1,80 @@
+import os
+from datetime import datetime
+from typing import Tuple
+
+import numpy as np
+import pandas as pd
+from scipy import sparse
+
+from app.tasks.similarity import build_interaction_matrix
+
+
+class InteractionState:
+    """
+    User x product interaction counts kept between retraining runs, together with the
+    watermark up to which orders and events have been consumed.
+    """
+
+    def __init__(self, matrix: sparse.csr_matrix, user_ids: np.ndarray, product_ids: np.ndarray, watermark: datetime):
+        self.matrix = matrix
+        self.user_ids = user_ids
+        self.product_ids = product_ids
+        self.watermark = watermark
+
+    @classmethod
+    def from_interactions(cls, interactions: pd.DataFrame, watermark: datetime) -> 'InteractionState':
+        matrix, user_ids, product_ids = build_interaction_matrix(interactions)
+        return cls(matrix, user_ids, product_ids, watermark)
+
+    def merge(self, interactions: pd.DataFrame, watermark: datetime) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Add new interaction rows. Unseen users and products are appended to the vocabularies,
+        so existing row and column positions stay valid.
+        Returns the positions of the users and products that changed.
+        """
+        self.user_ids = _extend_vocabulary(self.user_ids, interactions['user_id'])
+        self.product_ids = _extend_vocabulary(self.product_ids, interactions['product_id'])
+
+        user_positions = pd.Index(self.user_ids).get_indexer(interactions['user_id'].astype(str))
+        product_positions = pd.Index(self.product_ids).get_indexer(interactions['product_id'].astype(str))
+        shape = (len(self.user_ids), len(self.product_ids))
+
+        delta = sparse.csr_matrix(
+            (interactions['interaction_count'].to_numpy(dtype=np.float32), (user_positions, product_positions)),
+            shape=shape
+        )
+        matrix = self.matrix.copy()
+        matrix.resize(shape)
+        self.matrix = (matrix + delta).tocsr()
+        self.watermark = watermark
+
+        return np.unique(user_positions), np.unique(product_positions)
+
+    def save(self, path: str):
+        """Write the state atomically, so a crashed run never leaves a partial file"""
+        tmp_path = f"{path}.tmp.npz"
+        np.savez(
+            tmp_path,
+            data=self.matrix.data,
+            indices=self.matrix.indices,
+            indptr=self.matrix.indptr,
+            shape=np.array(self.matrix.shape),
+            user_ids=self.user_ids,
+            product_ids=self.product_ids,
+            watermark=np.array(self.watermark.isoformat())
+        )
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path: str) -> 'InteractionState':
+        with np.load(path, allow_pickle=False) as data:
+            matrix = sparse.csr_matrix((data['data'], data['indices'], data['indptr']), shape=tuple(data['shape']))
+            return cls(matrix, data['user_ids'], data['product_ids'], datetime.fromisoformat(str(data['watermark'])))
+
+
+def _extend_vocabulary(vocabulary: np.ndarray, ids: pd.Series) -> np.ndarray:
+    known = set(vocabulary.tolist())
+    new_ids = [id_ for id_ in pd.unique(ids.astype(str)) if id_ not in known]
+    if not new_ids:
+        return vocabulary
+    return np.concatenate([vocabulary, np.array(new_ids, dtype=str)])
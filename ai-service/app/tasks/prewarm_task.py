@@ -0,0 +1,61 @@
+import argparse
+import asyncio
+import time
+from typing import Optional
+
+from sqlalchemy import text
+
+from app.core.config import settings
+from app.core.database import async_session, batch_connection
+from app.services.model_registry import model_registries
+from app.services.recommendation_service import RecommendationService
+
+ACTIVE_USERS_QUERY = text("""
+    SELECT DISTINCT user_id
+    FROM user_events
+    WHERE created_at >= NOW() - make_interval(days => :days)
+""")
+
+async def prewarm_recommendations_task(limit: int = 10, batch_size: Optional[int] = None):
+    """
+    Precompute and cache recommendations for every recently active user.
+    Users are processed batch_size at a time through RecommendationService.get_recommendations_batch.
+    """
+    batch_size = batch_size or settings.prewarm_batch_size
+    started = time.perf_counter()
+    service = RecommendationService()
+
+    try:
+        # Same model and shop data the web workers serve from
+        for registry in model_registries.values():
+            await asyncio.to_thread(registry.reload_if_changed)
+        await service.shop_index.refresh()
+
+        async with batch_connection() as conn:
+            result = await conn.execute(ACTIVE_USERS_QUERY, {"days": settings.prewarm_active_days})
+            user_ids = [row[0] for row in result]
+
+        print(f"Pre-warming recommendations for {len(user_ids)} active users...")
+        for start in range(0, len(user_ids), batch_size):
+            async with async_session() as db:
+                await service.get_recommendations_batch(
+                    user_ids[start:start + batch_size],
+                    limit=limit,
+                    db=db,
+                    cache_ttl=settings.prewarm_cache_ttl_seconds
+                )
+
+        print(f"Recommendation pre-warm completed in {time.perf_counter() - started:.1f}s ({len(user_ids)} users)")
+
+    except Exception as e:
+        print(f"Error pre-warming recommendations: {e}")
+    finally:
+        await service.close()
+
+# Standalone entry point: python -m app.tasks.prewarm_task --limit 10 --batch-size 500
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Pre-warm cached recommendations for active users")
+    parser.add_argument("--limit", type=int, default=10, help="Recommendations per user")
+    parser.add_argument("--batch-size", type=int, default=settings.prewarm_batch_size)
+    args = parser.parse_args()
+    asyncio.run(prewarm_recommendations_task(args.limit, args.batch_size))
@@ -1,105 +1,225 @@
+import argparse
 import asyncio
-import pandas as pd
-from sklearn.metrics.pairwise import cosine_similarity
-from sklearn.preprocessing import StandardScaler
-import pickle
+import json
 import os
+import time
 from datetime import datetime
+from typing import Optional
 
-from app.core.database import get_database
-from app.core.config import settings
+import pandas as pd
+import redis.asyncio as redis
 
-async def retrain_model_task():
+from sqlalchemy import text
+
+from app.core.database import batch_connection, engine
+from app.core.config import settings
+from app.core.metrics import RETRAIN_RUN_KEY, peak_rss_mb
+from app.services.model_registry import content_index_registry, user_index_registry, item_index_registry
+from app.services.neighbor_index import NeighborIndex
+from app.services.trending import TrendingCounters
+from app.tasks.content_features import build_content_index
+from app.tasks.interaction_state import InteractionState
+from app.tasks.similarity import build_neighbor_indexes, update_neighbor_index
+
+INTERACTION_STATE_FILENAME = 'interactions.npz'
+
+# Delivered order lines count 1 each; browsing events count as weaker signals
+PRODUCTS_QUERY = text("""
+    SELECT p.id, p.name, p.description, p.category, p.price, p.shop_id
+    FROM products p
+    WHERE p.is_active = true
+""")
+
+INTERACTIONS_QUERY = text("""
+    SELECT user_id, product_id, SUM(weight) as interaction_count
+    FROM (
+        SELECT o.user_id, oi.product_id, 1.0 as weight
+        FROM orders o
+        JOIN order_items oi ON o.id = oi.order_id
+        WHERE o.status = 'DELIVERED'
+        AND COALESCE(o.delivered_at, o.updated_at) > :since
+        AND COALESCE(o.delivered_at, o.updated_at) <= :until
+
+        UNION ALL
+
+        SELECT ue.user_id, ue.product_id,
+               CASE ue.event_type WHEN 'add_to_cart' THEN 0.5 WHEN 'click' THEN 0.2 ELSE 0.1 END as weight
+        FROM user_events ue
+        WHERE ue.event_type IN ('view', 'click', 'add_to_cart')
+        AND ue.created_at > :since
+        AND ue.created_at <= :until
+    ) interactions
+    WHERE product_id IS NOT NULL
+    GROUP BY user_id, product_id
+""")
+
+async def retrain_model_task(workers: Optional[int] = None, mode: str = "full"):
     """
-    Background task to retrain the recommendation model
+    Retrain the recommendation model.
+    Runs outside the web workers, either from the CLI or the Celery retraining worker.
+    mode="full" rebuilds everything; mode="incremental" only consumes orders and events
+    since the last run and falls back to a full rebuild when no previous state exists.
     """
-    print("Starting model retraining...")
+    workers = workers or settings.retraining_workers
+    state_path = os.path.join(settings.model_path, INTERACTION_STATE_FILENAME)
+    if mode == "incremental" and not os.path.exists(state_path):
+        print("No interaction state found, running a full rebuild instead")
+        mode = "full"
 
-    try:
-        database = await get_database()
-
-        # Fetch user-product interaction data
-        query = """
-            SELECT
-                o.user_id,
-                oi.product_id,
-                COUNT(*) as interaction_count,
-                MAX(o.created_at) as last_interaction
-            FROM orders o
-            JOIN order_items oi ON o.id = oi.order_id
-            WHERE o.status = 'DELIVERED'
-            GROUP BY o.user_id, oi.product_id
-        """
-
-        interactions = await database.fetch_all(query)
-
-        if not interactions:
-            print("No interaction data found for training")
-            return
-
-        # Convert to DataFrame
-        df = pd.DataFrame([dict(row) for row in interactions])
+    print(f"Starting {mode} model retraining with {workers} worker(s)...")
 
-        # Create user-item matrix
-        user_item_matrix = df.pivot_table(
-            index='user_id',
-            columns='product_id',
-            values='interaction_count',
-            fill_value=0
-        )
+    try:
+        started = time.perf_counter()
 
-        # Calculate user similarity
-        if user_item_matrix.shape[0] > 1:
-            # Normalize the matrix
-            scaler = StandardScaler()
-            normalized_matrix = scaler.fit_transform(user_item_matrix)
+        # Leave a small lag so rows still being committed are picked up by the next run
+        async with engine.connect() as conn:
+            watermark = (await conn.execute(text("SELECT NOW() - INTERVAL '1 minute'"))).scalar()
 
-            # Calculate cosine similarity
-            user_similarity_matrix = cosine_similarity(normalized_matrix)
+        if mode == "incremental":
+            result = await _incremental_update(state_path, watermark)
+        else:
+            result = await _full_rebuild(watermark, workers)
 
-            # Create user similarity dictionary
-            user_similarity = {}
-            user_ids = user_item_matrix.index.tolist()
+        if result is not None:
+            state, user_index, item_index = result
 
-            for i, user_id in enumerate(user_ids):
-                similarities = []
-                for j, other_user_id in enumerate(user_ids):
-                    if i != j:
-                        similarities.append((other_user_id, user_similarity_matrix[i][j]))
+            # Save models; serving workers pick them up on their next registry poll
+            os.makedirs(settings.model_path, exist_ok=True)
+            for index, registry in ((user_index, user_index_registry), (item_index, item_index_registry)):
+                index.save(registry.path)
+                print(f"Model saved at {registry.path} ({len(index)} entries)")
 
-                # Sort by similarity score
-                similarities.sort(key=lambda x: x[1], reverse=True)
-                user_similarity[user_id] = similarities[:10]  # Top 10 similar users
+            # Advance the watermark only once the models it covers are published
+            state.save(state_path)
 
-            # Save model
-            model_path = os.path.join(settings.model_path, 'user_similarity.pkl')
-            with open(model_path, 'wb') as f:
-                pickle.dump(user_similarity, f)
+        # Content vectors only depend on the catalogue, so full runs rebuild them. They are built
+        # after the neighbor models are published and fail on their own, without losing that work.
+        if mode == "full" or not os.path.exists(content_index_registry.path):
+            try:
+                await _rebuild_content_index()
+            except Exception as e:
+                print(f"Error rebuilding the content index: {e}")
 
-            print(f"Model retrained and saved at {model_path}")
-        else:
-            print("Not enough users for collaborative filtering")
+        if result is None:
+            return
 
         # Update trending products cache
-        await update_trending_cache(database)
+        await update_trending_cache()
 
-        print("Model retraining completed")
+        seconds = time.perf_counter() - started
+        await _record_run(mode, seconds)
+        print(
+            f"Model retraining ({mode}) completed in {seconds:.1f}s "
+            f"({len(user_index)} users, {len(item_index)} items, peak RSS {peak_rss_mb():.0f} MB)"
+        )
 
     except Exception as e:
         print(f"Error during model retraining: {e}")
 
-async def update_trending_cache(database):
-    """Update trending products in Redis"""
+async def _fetch_interactions(since: datetime, until: datetime) -> pd.DataFrame:
+    """Fetch aggregated user-product interactions in the (since, until] window"""
+    async with batch_connection() as conn:
+        rows = (await conn.execute(INTERACTIONS_QUERY, {"since": since, "until": until})).fetchall()
+    return pd.DataFrame([tuple(row) for row in rows], columns=['user_id', 'product_id', 'interaction_count'])
+
+async def _full_rebuild(watermark: datetime, workers: int):
+    df = await _fetch_interactions(datetime(1970, 1, 1, tzinfo=watermark.tzinfo), watermark)
+
+    if df.empty:
+        print("No interaction data found for training")
+        return None
+
+    state = InteractionState.from_interactions(df, watermark)
+
+    # Sparse user x item matrix with blocked top-K cosine similarity, off the event loop
+    user_index, item_index = await asyncio.to_thread(
+        build_neighbor_indexes,
+        df,
+        settings.user_neighbors_k,
+        settings.item_neighbors_k,
+        settings.similarity_block_bytes,
+        workers
+    )
+
+    return state, user_index, item_index
+
+async def _incremental_update(state_path: str, watermark: datetime):
+    state = InteractionState.load(state_path)
+    df = await _fetch_interactions(state.watermark, watermark)
+
+    if df.empty:
+        print(f"No new interactions since {state.watermark.isoformat()}")
+        return None
+
+    def update():
+        user_index = NeighborIndex.load(user_index_registry.path)
+        item_index = NeighborIndex.load(item_index_registry.path)
+        changed_users, changed_items = state.merge(df, watermark)
+        # Only the users and items that received new interactions get new neighbor lists
+        new_user_index = update_neighbor_index(
+            user_index, state.matrix, state.user_ids, changed_users,
+            settings.user_neighbors_k, settings.similarity_block_bytes
+        )
+        new_item_index = update_neighbor_index(
+            item_index, state.matrix.T.tocsr(), state.product_ids, changed_items,
+            settings.item_neighbors_k, settings.similarity_block_bytes
+        )
+        print(f"Updated neighbors for {len(changed_users)} users and {len(changed_items)} items")
+        return new_user_index, new_item_index
+
+    user_index, item_index = await asyncio.to_thread(update)
+    return state, user_index, item_index
+
+async def _rebuild_content_index():
+    """Build and publish product feature vectors for the content-similarity source"""
+    async with batch_connection() as conn:
+        rows = (await conn.execute(PRODUCTS_QUERY)).fetchall()
+    if not rows:
+        print("No active products found for the content index")
+        return
+
+    products = pd.DataFrame([tuple(row) for row in rows], columns=['id', 'name', 'description', 'category', 'price', 'shop_id'])
+    content_index = await asyncio.to_thread(build_content_index, products, settings.content_vector_dims)
+
+    os.makedirs(settings.model_path, exist_ok=True)
+    content_index.save(content_index_registry.path)
+    print(f"Model saved at {content_index_registry.path} ({len(content_index)} entries)")
+
+async def _record_run(mode: str, seconds: float):
+    """Publish the run's duration for the web workers' /metrics endpoint"""
+    redis_client = redis.from_url(settings.redis_url)
     try:
-        from app.services.recommendation_service import RecommendationService
+        await redis_client.set(
+            RETRAIN_RUN_KEY.format(mode=mode),
+            json.dumps({"seconds": seconds, "completed_at": time.time()})
+        )
+    except Exception as e:
+        print(f"Error recording retraining run: {e}")
+    finally:
+        await redis_client.aclose()
 
-        # This would be called to refresh trending data
-        # In a real implementation, you might cache aggregated trending data
-        print("Trending cache updated")
+async def update_trending_cache():
+    """Re-aggregate the rolling trending counters in Redis"""
+    redis_client = redis.from_url(settings.redis_url)
+    try:
+        trending = TrendingCounters(
+            redis_client,
+            window_hours=settings.trending_window_hours,
+            half_life_hours=settings.trending_half_life_hours,
+            max_products=settings.trending_max_products
+        )
+        scopes = await trending.aggregate()
+        print(f"Trending cache updated ({scopes} scopes)")
 
     except Exception as e:
         print(f"Error updating trending cache: {e}")
+    finally:
+        await redis_client.aclose()
 
-# For testing
+# Standalone entry point: python -m app.tasks.retraining_task --workers 4 --mode incremental
 if __name__ == "__main__":
-    asyncio.run(retrain_model_task())
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="Retrain the recommendation model")
+    parser.add_argument("--workers", type=int, default=settings.retraining_workers, help="Similarity worker processes")
+    parser.add_argument("--mode", choices=["full", "incremental"], default="full")
+    args = parser.parse_args()
+    asyncio.run(retrain_model_task(args.workers, args.mode))
@@ -0,0 +1,90 @@
+import argparse
+import asyncio
+import time
+from datetime import date, datetime, timedelta, timezone
+from typing import Optional
+
+from sqlalchemy import text
+
+from app.core.config import settings
+from app.core.database import batch_connection, create_tables
+
+# Whole days are recomputed and overwritten, so re-running a range never double counts
+UPSERT_DAYS_QUERY = text("""
+    INSERT INTO shop_daily_orders (shop_id, day, order_count, updated_at)
+    SELECT o.shop_id, (o.created_at AT TIME ZONE 'UTC')::date as day, COUNT(*), NOW()
+    FROM orders o
+    WHERE o.created_at >= CAST(:start_day AS date)
+    AND o.created_at < CAST(:end_day AS date)
+    AND o.shop_id IS NOT NULL
+    GROUP BY o.shop_id, day
+    ON CONFLICT (shop_id, day) DO UPDATE
+    SET order_count = EXCLUDED.order_count, updated_at = EXCLUDED.updated_at
+""")
+
+PRUNE_QUERY = text("""
+    DELETE FROM shop_daily_orders
+    WHERE day < CAST(:before_day AS date)
+""")
+
+FIRST_ORDER_DAY_QUERY = text("""
+    SELECT MIN((created_at AT TIME ZONE 'UTC')::date) FROM orders
+""")
+
+async def _upsert_days(start_day: date, end_day: date):
+    """Recompute the buckets of [start_day, end_day)"""
+    async with batch_connection() as conn:
+        # The session time zone is UTC so the date bounds match the UTC day buckets
+        await conn.execute(text("SET LOCAL TIME ZONE 'UTC'"))
+        await conn.execute(UPSERT_DAYS_QUERY, {"start_day": start_day, "end_day": end_day})
+
+async def refresh_shop_rollups(days: Optional[int] = None):
+    """
+    Recompute the most recent day buckets, including today, and drop buckets past retention.
+    Recent days are recomputed rather than incremented, so late or updated orders are picked up.
+    """
+    days = days or settings.shop_rollup_refresh_days
+    started = time.perf_counter()
+    today = datetime.now(timezone.utc).date()
+
+    try:
+        await _upsert_days(today - timedelta(days=days - 1), today + timedelta(days=1))
+        async with batch_connection() as conn:
+            await conn.execute(PRUNE_QUERY, {"before_day": today - timedelta(days=settings.shop_rollup_retention_days)})
+        print(f"Shop rollups refreshed for the last {days} day(s) in {time.perf_counter() - started:.1f}s")
+    except Exception as e:
+        print(f"Error refreshing shop rollups: {e}")
+
+async def backfill_shop_rollups(days: Optional[int] = None, chunk_days: int = 7):
+    """Build buckets for the whole retention window (or `days` back), chunk_days per statement"""
+    started = time.perf_counter()
+    await create_tables()
+
+    today = datetime.now(timezone.utc).date()
+    start_day = today - timedelta(days=(days or settings.shop_rollup_retention_days) - 1)
+    async with batch_connection() as conn:
+        first_order_day = (await conn.execute(FIRST_ORDER_DAY_QUERY)).scalar()
+    if first_order_day is None:
+        print("No orders to backfill")
+        return
+    start_day = max(start_day, first_order_day)
+
+    while start_day <= today:
+        end_day = min(start_day + timedelta(days=chunk_days), today + timedelta(days=1))
+        await _upsert_days(start_day, end_day)
+        print(f"Backfilled shop rollups for {start_day.isoformat()} to {(end_day - timedelta(days=1)).isoformat()}")
+        start_day = end_day
+
+    print(f"Shop rollup backfill completed in {time.perf_counter() - started:.1f}s")
+
+# Usage: python -m app.tasks.shop_rollups --backfill [--days 90]
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Maintain daily order counts per shop")
+    parser.add_argument("--backfill", action="store_true", help="Rebuild every bucket in the window instead of the recent days")
+    parser.add_argument("--days", type=int, help="Days to refresh or backfill")
+    args = parser.parse_args()
+
+    if args.backfill:
+        asyncio.run(backfill_shop_rollups(args.days))
+    else:
+        asyncio.run(refresh_shop_rollups(args.days))
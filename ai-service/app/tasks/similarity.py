@@ -0,0 +1,166 @@
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from typing import Optional, Tuple
+
+import numpy as np
+import pandas as pd
+from scipy import sparse
+from sklearn.preprocessing import normalize
+
+from app.services.neighbor_index import NeighborIndex
+
+
+def build_interaction_matrix(interactions: pd.DataFrame) -> Tuple[sparse.csr_matrix, np.ndarray, np.ndarray]:
+    """
+    Build a sparse user x product matrix from (user_id, product_id, interaction_count) rows.
+    Returns the CSR matrix and the user and product id vocabularies for its rows and columns.
+    """
+    user_codes, user_ids = pd.factorize(interactions['user_id'])
+    product_codes, product_ids = pd.factorize(interactions['product_id'])
+
+    matrix = sparse.csr_matrix(
+        (interactions['interaction_count'].to_numpy(dtype=np.float32), (user_codes, product_codes)),
+        shape=(len(user_ids), len(product_ids))
+    )
+    # Duplicate (user, product) pairs are summed by the constructor
+    matrix.sum_duplicates()
+
+    return matrix, np.asarray(user_ids).astype(str), np.asarray(product_ids).astype(str)
+
+
+# Per-process state for pool workers, set once by _init_worker so chunks don't re-send the matrix
+_worker_matrix: Optional[sparse.csr_matrix] = None
+_worker_matrix_t: Optional[sparse.csr_matrix] = None
+
+
+def _init_worker(normalized: sparse.csr_matrix, normalized_t: sparse.csr_matrix):
+    global _worker_matrix, _worker_matrix_t
+    _worker_matrix, _worker_matrix_t = normalized, normalized_t
+
+
+def _top_k_block(
+    normalized: sparse.csr_matrix,
+    normalized_t: sparse.csr_matrix,
+    rows: np.ndarray,
+    k: int
+) -> Tuple[np.ndarray, np.ndarray]:
+    """Top-k neighbors for the given rows"""
+    block = (normalized[rows] @ normalized_t).toarray()
+    # Exclude self-similarity
+    block[np.arange(len(rows)), rows] = -np.inf
+
+    # Partition in place of a negated copy to keep the block's footprint down
+    top = np.argpartition(block, -k, axis=1)[:, -k:]
+    top_scores = np.take_along_axis(block, top, axis=1)
+    order = np.argsort(-top_scores, axis=1)
+    top = np.take_along_axis(top, order, axis=1)
+    top_scores = np.take_along_axis(top_scores, order, axis=1)
+
+    positive = top_scores > 0
+    return np.where(positive, top, -1).astype(np.int32), np.where(positive, top_scores, 0).astype(np.float32)
+
+
+def _top_k_chunk(start: int, end: int, k: int) -> Tuple[int, np.ndarray, np.ndarray]:
+    neighbors, scores = _top_k_block(_worker_matrix, _worker_matrix_t, np.arange(start, end), k)
+    return start, neighbors, scores
+
+
+def top_k_cosine(
+    matrix: sparse.csr_matrix,
+    k: int,
+    max_block_bytes: int,
+    workers: int = 1
+) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Top-k cosine neighbors for every row of a sparse matrix.
+    Similarities are computed one block of rows at a time, so peak memory is bounded by
+    max_block_bytes (per worker) instead of growing with rows².
+    With workers > 1 the blocks are spread over a process pool.
+    Returns (neighbors, scores) arrays of shape (rows, k); slots without a positive neighbor are -1.
+    """
+    n_rows = matrix.shape[0]
+    k = max(0, min(k, n_rows - 1))
+    neighbors = np.full((n_rows, k), -1, dtype=np.int32)
+    scores = np.zeros((n_rows, k), dtype=np.float32)
+    if k == 0:
+        return neighbors, scores
+
+    normalized = normalize(matrix.astype(np.float32), norm='l2', axis=1)
+    normalized_t = normalized.T.tocsr()
+    block_rows = max(1, max_block_bytes // (n_rows * 4))
+    blocks = [(start, min(start + block_rows, n_rows)) for start in range(0, n_rows, block_rows)]
+
+    if workers <= 1 or len(blocks) == 1:
+        for start, end in blocks:
+            neighbors[start:end], scores[start:end] = _top_k_block(normalized, normalized_t, np.arange(start, end), k)
+        return neighbors, scores
+
+    # Spawned (not forked) workers, since retraining may be started from a thread
+    with ProcessPoolExecutor(
+        max_workers=min(workers, len(blocks)),
+        mp_context=multiprocessing.get_context('spawn'),
+        initializer=_init_worker,
+        initargs=(normalized, normalized_t)
+    ) as pool:
+        futures = [pool.submit(_top_k_chunk, start, end, k) for start, end in blocks]
+        for future in as_completed(futures):
+            start, block_neighbors, block_scores = future.result()
+            neighbors[start:start + len(block_neighbors)] = block_neighbors
+            scores[start:start + len(block_scores)] = block_scores
+
+    return neighbors, scores
+
+
+def update_neighbor_index(
+    index: NeighborIndex,
+    matrix: sparse.csr_matrix,
+    ids: np.ndarray,
+    rows: np.ndarray,
+    k: int,
+    max_block_bytes: int
+) -> NeighborIndex:
+    """
+    Recompute the neighbor lists of the given rows only, keeping every other row as it was.
+    rows index into matrix and ids, which may contain entries the index hasn't seen yet.
+    Unchanged rows can hold slightly stale scores until the next full rebuild.
+    """
+    n_rows = matrix.shape[0]
+    k = max(0, min(k, n_rows - 1))
+    neighbors = np.full((n_rows, k), -1, dtype=np.int32)
+    scores = np.zeros((n_rows, k), dtype=np.float32)
+
+    # Carry over existing lists, translating the index's positions to positions in ids
+    kept = min(k, index.neighbors.shape[1])
+    old_rows = pd.Index(ids).get_indexer(np.asarray(index.ids))
+    old_neighbors = np.asarray(index.neighbors[:, :kept])
+    neighbors[old_rows, :kept] = np.where(old_neighbors >= 0, old_rows[np.maximum(old_neighbors, 0)], -1)
+    scores[old_rows, :kept] = index.scores[:, :kept]
+
+    if k > 0 and len(rows):
+        normalized = normalize(matrix.astype(np.float32), norm='l2', axis=1)
+        normalized_t = normalized.T.tocsr()
+        block_rows = max(1, max_block_bytes // (n_rows * 4))
+        for start in range(0, len(rows), block_rows):
+            block = rows[start:start + block_rows]
+            neighbors[block], scores[block] = _top_k_block(normalized, normalized_t, block, k)
+
+    return NeighborIndex.from_arrays(ids, neighbors, scores)
+
+
+def build_neighbor_indexes(
+    interactions: pd.DataFrame,
+    user_k: int,
+    item_k: int,
+    max_block_bytes: int,
+    workers: int = 1
+) -> Tuple[NeighborIndex, NeighborIndex]:
+    """Build the user-user and item-item neighbor indexes from interaction rows"""
+    matrix, user_ids, product_ids = build_interaction_matrix(interactions)
+
+    user_neighbors, user_scores = top_k_cosine(matrix, user_k, max_block_bytes, workers)
+    item_neighbors, item_scores = top_k_cosine(matrix.T.tocsr(), item_k, max_block_bytes, workers)
+
+    return (
+        NeighborIndex.from_arrays(user_ids, user_neighbors, user_scores),
+        NeighborIndex.from_arrays(product_ids, item_neighbors, item_scores),
+    )
@@ -0,0 +1,79 @@
+"""
+Compare recommendation cache latency under concurrent load for the
+synchronous redis client (previous behaviour) and redis.asyncio.
+
+Usage:
+    python -m benchmarks.cache_latency --requests 2000 --concurrency 100
+"""
+import argparse
+import asyncio
+import json
+import time
+import uuid
+
+import redis
+import redis.asyncio as aioredis
+
+from app.core.config import settings
+from benchmarks.common import summarize_latencies
+
+PAYLOAD = json.dumps([{'product_id': str(i), 'score': 0.5, 'reason': 'benchmark'} for i in range(10)])
+
+
+async def _sync_request(client: redis.Redis, key: str, work_seconds: float) -> float:
+    started = time.perf_counter()
+    if client.get(key) is None:
+        await asyncio.sleep(work_seconds)  # Stand-in for the DB pipeline on a cache miss
+        client.setex(key, 60, PAYLOAD)
+    return time.perf_counter() - started
+
+
+async def _async_request(client: aioredis.Redis, key: str, work_seconds: float) -> float:
+    started = time.perf_counter()
+    if await client.get(key) is None:
+        await asyncio.sleep(work_seconds)
+        await client.setex(key, 60, PAYLOAD)
+    return time.perf_counter() - started
+
+
+async def _run(request_fn, client, keys, concurrency: int, work_seconds: float) -> dict:
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def bounded(key):
+        async with semaphore:
+            return await request_fn(client, key, work_seconds)
+
+    started = time.perf_counter()
+    latencies = await asyncio.gather(*(bounded(key) for key in keys))
+    return summarize_latencies(latencies, time.perf_counter() - started)
+
+
+async def main(args):
+    prefix = f"benchmark:{uuid.uuid4().hex}"
+    # Half of the keys repeat, so the run mixes cache hits and misses
+    keys = [f"{prefix}:{i % (args.requests // 2 or 1)}" for i in range(args.requests)]
+
+    sync_client = redis.Redis.from_url(args.redis_url, max_connections=args.concurrency)
+    sync_result = await _run(_sync_request, sync_client, [f"{k}:sync" for k in keys], args.concurrency, args.work_ms / 1000)
+
+    async_pool = aioredis.BlockingConnectionPool.from_url(args.redis_url, max_connections=args.concurrency)
+    async_client = aioredis.Redis(connection_pool=async_pool)
+    async_result = await _run(_async_request, async_client, [f"{k}:async" for k in keys], args.concurrency, args.work_ms / 1000)
+
+    # Clean up benchmark keys
+    for key in sync_client.scan_iter(f"{prefix}:*"):
+        sync_client.delete(key)
+    sync_client.close()
+    await async_client.aclose()
+    await async_pool.disconnect()
+
+    print(json.dumps({'sync_redis': sync_result, 'async_redis': async_result}, indent=2))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Redis cache latency benchmark")
+    parser.add_argument("--redis-url", default=settings.redis_url)
+    parser.add_argument("--requests", type=int, default=2000)
+    parser.add_argument("--concurrency", type=int, default=100)
+    parser.add_argument("--work-ms", type=float, default=20, help="Simulated DB time on a cache miss")
+    asyncio.run(main(parser.parse_args()))
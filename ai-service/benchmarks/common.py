@@ -0,0 +1,37 @@
+"""Helpers shared by the benchmark scripts."""
+import multiprocessing
+
+import numpy as np
+
+from app.core.metrics import peak_rss_mb
+
+
+def summarize_latencies(latencies, elapsed: float) -> dict:
+    """Request count, throughput and latency percentiles for per-request durations in seconds"""
+    latencies_ms = np.array(latencies) * 1000
+    return {
+        'requests': len(latencies),
+        'throughput_rps': round(len(latencies) / elapsed, 1) if elapsed else None,
+        'p50_ms': round(float(np.percentile(latencies_ms, 50)), 3),
+        'p95_ms': round(float(np.percentile(latencies_ms, 95)), 3),
+        'p99_ms': round(float(np.percentile(latencies_ms, 99)), 3),
+        'max_ms': round(float(latencies_ms.max()), 3),
+    }
+
+
+def _child(target, args, queue):
+    queue.put({**target(*args), 'peak_rss_mb': round(peak_rss_mb(), 1)})
+
+
+def run_isolated(target, *args) -> dict:
+    """
+    Run target(*args) in a fresh spawned process and return its result dict with the
+    child's peak RSS added, so memory is measured per run. target must be importable.
+    """
+    context = multiprocessing.get_context('spawn')
+    queue = context.Queue()
+    process = context.Process(target=_child, args=(target, args, queue))
+    process.start()
+    result = queue.get()
+    process.join()
+    return result
@@ -0,0 +1,64 @@
+"""
+Measure how the sparse retraining pipeline scales with users and items.
+Each size runs in a fresh process so peak RSS is reported per run.
+
+Usage:
+    python -m benchmarks.retrain_scaling --sizes 10000x2000 100000x20000
+"""
+import argparse
+import json
+import time
+
+import numpy as np
+import pandas as pd
+
+from app.core.config import settings
+from app.tasks.similarity import build_neighbor_indexes
+from benchmarks.common import run_isolated
+
+
+def synthetic_interactions(users: int, items: int, per_user: int, seed: int = 0) -> pd.DataFrame:
+    """Random interactions with a skewed (Zipf-like) item popularity"""
+    rng = np.random.default_rng(seed)
+    popularity = 1 / np.arange(1, items + 1)
+    popularity /= popularity.sum()
+
+    user_ids = np.repeat(np.arange(users), per_user)
+    product_ids = rng.choice(items, size=len(user_ids), p=popularity)
+    return pd.DataFrame({
+        'user_id': user_ids.astype(str),
+        'product_id': product_ids.astype(str),
+        'interaction_count': rng.integers(1, 5, size=len(user_ids)),
+    })
+
+
+def _run(users: int, items: int, per_user: int, block_bytes: int) -> dict:
+    df = synthetic_interactions(users, items, per_user)
+    started = time.perf_counter()
+    user_index, item_index = build_neighbor_indexes(
+        df, settings.user_neighbors_k, settings.item_neighbors_k, block_bytes
+    )
+    return {
+        'users': users,
+        'items': items,
+        'interactions': len(df),
+        'seconds': round(time.perf_counter() - started, 3),
+    }
+
+
+def main(args):
+    results = []
+    for size in args.sizes:
+        users, items = (int(part) for part in size.split('x'))
+        results.append(run_isolated(_run, users, items, args.per_user, args.block_bytes))
+        print(json.dumps(results[-1]))
+
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Retraining pipeline scaling benchmark")
+    parser.add_argument("--sizes", nargs="+", default=["1000x500", "10000x2000", "50000x10000"], help="USERSxITEMS")
+    parser.add_argument("--per-user", type=int, default=20, help="Interactions per user")
+    parser.add_argument("--block-bytes", type=int, default=settings.similarity_block_bytes)
+    main(parser.parse_args())
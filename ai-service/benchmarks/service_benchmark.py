@@ -0,0 +1,185 @@
+"""
+Timed scenarios for the recommendation service against a database loaded by
+benchmarks.synthetic_data (plus the Redis at REDIS_URL).
+
+Scenarios:
+    recommend_cold  get_recommendations with every user's cache entry invalidated first
+    recommend_warm  the same requests again, served from the recommendation cache
+    events          track_event calls, then the time to flush the write-behind buffer
+    retrain_full    retrain_model_task(mode="full")
+    retrain_incremental  retrain_model_task(mode="incremental") after the full run
+
+Each scenario runs in a fresh process so peak RSS is reported per scenario. Results are
+printed and, with --output, written as one JSON document for comparing releases.
+
+Usage:
+    python -m benchmarks.service_benchmark --requests 2000 --concurrency 1 10 50 --output results.json
+"""
+import argparse
+import asyncio
+import json
+import multiprocessing
+import platform
+import subprocess
+import time
+from datetime import datetime, timezone
+from typing import Optional
+
+import numpy as np
+
+from app.core.config import settings
+from benchmarks.common import run_isolated, summarize_latencies
+
+SCENARIOS = ['recommend_cold', 'recommend_warm', 'events', 'retrain_full', 'retrain_incremental']
+
+
+async def _timed_concurrently(call, arguments, concurrency: int) -> dict:
+    """Run call(argument) for every argument with at most `concurrency` in flight"""
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def timed(argument):
+        async with semaphore:
+            started = time.perf_counter()
+            await call(argument)
+            return time.perf_counter() - started
+
+    started = time.perf_counter()
+    latencies = await asyncio.gather(*(timed(argument) for argument in arguments))
+    return summarize_latencies(latencies, time.perf_counter() - started)
+
+
+async def _sample_users(count: int, seed: int) -> list:
+    from sqlalchemy import text
+    from app.core.database import async_session
+
+    async with async_session() as db:
+        result = await db.execute(
+            text("SELECT id, latitude, longitude FROM users ORDER BY md5(id || :seed) LIMIT :count"),
+            {"seed": str(seed), "count": count}
+        )
+        return [tuple(row) for row in result]
+
+
+async def _recommend(args, concurrency: int, warm: bool) -> dict:
+    from app.core.database import async_session
+    from app.services.model_registry import model_registries
+    from app.services.recommendation_service import RecommendationService
+
+    # Every model the web workers serve, so the content index path is exercised too
+    for registry in model_registries.values():
+        registry.reload_if_changed()
+
+    service = RecommendationService()
+    await service.start()
+    try:
+        users = await _sample_users(args.requests, args.seed)
+
+        async def recommend(user):
+            user_id, latitude, longitude = user
+            async with async_session() as db:
+                await service.get_recommendations(user_id, latitude, longitude, args.limit, db)
+
+        # A new cache generation per user makes every first request a miss
+        async with service.redis_client.pipeline(transaction=False) as pipe:
+            for user_id, _, _ in users:
+                pipe.incr(f"recommendation_generation:{user_id}")
+            await pipe.execute()
+
+        if warm:
+            await _timed_concurrently(recommend, users, concurrency)
+        return await _timed_concurrently(recommend, users, concurrency)
+    finally:
+        await service.close()
+
+
+async def _events(args, concurrency: int) -> dict:
+    from app.schemas.recommendation import UserEventCreate
+    from app.services.recommendation_service import RecommendationService
+
+    service = RecommendationService()
+    await service.start()
+    try:
+        users = await _sample_users(min(args.requests, 1000), args.seed)
+        rng = np.random.default_rng(args.seed)
+        events = [
+            UserEventCreate(
+                user_id=users[i % len(users)][0],
+                event_type='view',
+                event_data={'product_id': f"p{rng.integers(0, 1000):08d}", 'source': 'benchmark'}
+            )
+            for i in range(args.requests)
+        ]
+
+        result = await _timed_concurrently(service.track_event, events, concurrency)
+        started = time.perf_counter()
+        await service.event_buffer.flush()
+        result['flush_seconds'] = round(time.perf_counter() - started, 3)
+        return result
+    finally:
+        await service.close()
+
+
+async def _retrain(mode: str) -> dict:
+    from app.tasks.retraining_task import retrain_model_task
+
+    started = time.perf_counter()
+    await retrain_model_task(settings.retraining_workers, mode)
+    return {'seconds': round(time.perf_counter() - started, 3), 'workers': settings.retraining_workers}
+
+
+def _run_scenario(scenario: str, concurrency: int, args) -> dict:
+    if scenario == 'recommend_cold':
+        result = asyncio.run(_recommend(args, concurrency, warm=False))
+    elif scenario == 'recommend_warm':
+        result = asyncio.run(_recommend(args, concurrency, warm=True))
+    elif scenario == 'events':
+        result = asyncio.run(_events(args, concurrency))
+    else:
+        result = asyncio.run(_retrain(scenario.split('_', 1)[1]))
+    return {'scenario': scenario, 'concurrency': concurrency, **result}
+
+
+def _git_commit() -> Optional[str]:
+    try:
+        return subprocess.check_output(['git', 'rev-parse', 'HEAD'], text=True).strip()
+    except Exception:
+        return None
+
+
+def main(args):
+    results = []
+    for scenario in args.scenarios:
+        # Retraining is a single job, so concurrency levels only apply to the request paths
+        levels = [1] if scenario.startswith('retrain') else args.concurrency
+        for concurrency in levels:
+            results.append(run_isolated(_run_scenario, scenario, concurrency, args))
+            print(json.dumps(results[-1]))
+
+    report = {
+        'started_at': datetime.now(timezone.utc).isoformat(),
+        'commit': _git_commit(),
+        'python': platform.python_version(),
+        'cpu_count': multiprocessing.cpu_count(),
+        'settings': {
+            'database_pool_size': settings.database_pool_size,
+            'redis_max_connections': settings.redis_max_connections,
+            'retraining_workers': settings.retraining_workers,
+        },
+        'parameters': {'requests': args.requests, 'limit': args.limit, 'seed': args.seed},
+        'results': results,
+    }
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+    return report
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Recommendation service benchmark scenarios")
+    parser.add_argument("--scenarios", nargs="+", choices=SCENARIOS, default=SCENARIOS)
+    parser.add_argument("--requests", type=int, default=1000, help="Requests per request-path scenario")
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 10, 50])
+    parser.add_argument("--limit", type=int, default=10, help="Recommendations per request")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="Write the full report as JSON to this path")
+    main(parser.parse_args())
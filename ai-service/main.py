@@ -1,14 +1,26 @@
-from fastapi import FastAPI, HTTPException, BackgroundTasks
+from fastapi import FastAPI, HTTPException, Request, Response
 from fastapi.middleware.cors import CORSMiddleware
 import uvicorn
+import asyncio
 import os
+import time
 from dotenv import load_dotenv
+from prometheus_client import CONTENT_TYPE_LATEST, generate_latest
 
 from app.api.routes import router
 from app.core.config import settings
-from app.core.database import create_tables
+from app.core.database import create_tables, get_pool_stats
+from app.core.metrics import (
+    REQUEST_SECONDS,
+    finish_query_count,
+    observe_models,
+    observe_pool,
+    observe_retrain_runs,
+    start_query_count
+)
 from app.services.recommendation_service import RecommendationService
-from app.tasks.retraining_task import retrain_model_task
+from app.services.model_registry import model_registries
+from app.tasks.celery_app import retrain_model as retrain_model_job
 
 load_dotenv()
 
@@ -27,6 +39,22 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# Latency and SQL statement count per route template
+@app.middleware("http")
+async def record_request_metrics(request: Request, call_next):
+    started = time.perf_counter()
+    token = start_query_count()
+    status = 500
+    try:
+        response = await call_next(request)
+        status = response.status_code
+        return response
+    finally:
+        route = request.scope.get("route")
+        route = route.path if route else "unmatched"
+        REQUEST_SECONDS.labels(request.method, route, str(status)).observe(time.perf_counter() - started)
+        finish_query_count(token, route)
+
 # Include routers
 app.include_router(router, prefix="/api/v1")
 
@@ -43,16 +71,59 @@ async def startup_event():
 
     # Initialize recommendation service
     recommendation_service = RecommendationService()
+    await recommendation_service.start()
     app.state.recommendation_service = recommendation_service
 
+    # Load the collaborative filtering models once and watch for retrained versions
+    for registry in model_registries.values():
+        await asyncio.to_thread(registry.reload_if_changed)
+        registry.start_watching(settings.model_reload_interval_seconds)
+
     print("AI Service started successfully")
 
+# Shutdown event
+@app.on_event("shutdown")
+async def shutdown_event():
+    for registry in model_registries.values():
+        await registry.stop_watching()
+
+    recommendation_service = getattr(app.state, "recommendation_service", None)
+    if recommendation_service:
+        await recommendation_service.close()
+
 # Retraining endpoint (admin only)
 @app.post("/admin/retrain-model")
-async def retrain_model(background_tasks: BackgroundTasks):
+async def retrain_model(mode: str = "full"):
     # In production, add authentication here
-    background_tasks.add_task(retrain_model_task)
-    return {"message": "Model retraining started in background"}
+    if mode not in ("full", "incremental"):
+        raise HTTPException(status_code=400, detail="mode must be 'full' or 'incremental'")
+
+    # Retraining runs in the Celery retraining worker so it never competes with request handling
+    result = await asyncio.to_thread(retrain_model_job.delay, mode=mode)
+    return {"message": "Model retraining queued", "task_id": result.id}
+
+# Currently served model version (admin only)
+@app.get("/admin/model-status")
+async def model_status():
+    return {name: registry.status() for name, registry in model_registries.items()}
+
+# Cache hit/miss counts per layer for this worker (admin only)
+@app.get("/admin/cache-stats")
+async def cache_stats():
+    return app.state.recommendation_service.get_cache_stats()
+
+# Prometheus metrics for this worker
+@app.get("/metrics")
+async def metrics():
+    observe_models(model_registries)
+    observe_pool()
+    await observe_retrain_runs(app.state.recommendation_service.redis_client)
+    return Response(generate_latest(), media_type=CONTENT_TYPE_LATEST)
+
+# Database connection pool usage for this worker (admin only)
+@app.get("/admin/db-pool")
+async def db_pool():
+    return get_pool_stats()
 
 if __name__ == "__main__":
     uvicorn.run(